@@ -4,32 +4,161 @@ FastAPI backend для подключения веб-приложения к Pos
 """
 
 import os
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hashlib
+from bisect import bisect_left
+from email.utils import format_datetime
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
-import asyncpg
+from typing import NamedTuple, Optional
 from contextlib import asynccontextmanager
 import logging
-import httpx
+import orjson
+
+from db import (
+    PoolRouter, create_pool, decode_keyset_cursor, encode_keyset_cursor,
+    get_active_posters, get_active_posters_page, get_public_stats, get_poster_by_id as db_get_poster_by_id,
+    get_poster_attendances_page, get_poster_change_version, get_posters_by_ids, get_user_attendances_page,
+)
+from health import HealthProber, read_heartbeat
+from manifest import ManifestPublisher
+import metrics
+from photo_cache import PHOTO_CACHE_ACCEL_PREFIX, PhotoNotFound, TelegramPhotoCache
+from poster_events import PosterChangeListener, PosterEventHub
+from poster_storage import IMMUTABLE_CACHE_CONTROL, POSTERS_DIR, is_content_addressed, local_path
+from poster_store import PosterStore
+from ratelimit import photo_limiter, posters_limiter
+from response_encoding import CompressionMiddleware, ORJSONResponse
+from rollups import AttendanceRollup
+from stats_cache import StatsCache
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("TusaBotAPI")
 
-# Настройки БД из переменных окружения
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = int(os.getenv("DB_PORT", "5432"))
-DB_NAME = os.getenv("DB_NAME", "FamilyDB")
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "1")
-
 # Telegram Bot Token для получения файлов
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 
-# Глобальный пул соединений
-db_pool: Optional[asyncpg.Pool] = None
+# Размер страницы /posters?cursor=..., если limit не указан
+POSTERS_PAGE_SIZE = int(os.getenv("POSTERS_PAGE_SIZE", "20"))
+
+# Максимум ID в одном запросе /posters/batch
+POSTERS_BATCH_MAX_IDS = 100
+
+# Интервал комментариев keep-alive в потоке /posters/events
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "25"))
+
+# Токен для служебных эндпоинтов (заголовок X-Admin-Token)
+API_ADMIN_TOKEN = os.getenv("API_ADMIN_TOKEN", "")
+
+# Глобальный пул соединений (основная БД + необязательная реплика для чтения)
+db_pool: Optional[PoolRouter] = None
+
+# Кешированная сводка посещаемости
+attendance_rollup = AttendanceRollup()
+
+# Снимок /stats, который обновляет фоновая задача
+stats_cache = StatsCache(lambda: get_public_stats(db_pool))
+
+
+async def _check_database() -> None:
+    if not db_pool:
+        raise RuntimeError("Database pool not initialized")
+    async with db_pool.acquire() as conn:
+        await conn.fetchval("SELECT 1")
+
+
+async def _check_telegram() -> None:
+    if not photo_cache:
+        raise RuntimeError("Bot token not configured")
+    await photo_cache.ping()
+
+
+async def _check_bot() -> None:
+    read_heartbeat()
+
+
+# Проверки выполняются в фоне; /health* отвечают из их последнего результата
+health_prober = HealthProber(
+    {"database": _check_database, "telegram": _check_telegram, "bot": _check_bot},
+    required=("database",),
+)
+
+# Активные афиши в памяти (строки БД по id), обновляются через LISTEN/NOTIFY
+poster_cache = PosterStore()
+posters_loaded = False
+# Наибольшая применённая версия изменений афиш (общая последовательность в БД)
+poster_change_version = 0
+poster_listener: Optional[PosterChangeListener] = None
+
+# Изменения афиш для SSE-подписчиков мини-приложения
+poster_events = PosterEventHub()
+
+# Фото из Telegram, закешированные на диске (прокси /photo/{file_id})
+photo_cache: Optional[TelegramPhotoCache] = None
+
+# Статический posters.json для nginx, переписывается после изменений афиш
+manifest_publisher: Optional[ManifestPublisher] = None
+
+
+def _posters_changed() -> None:
+    if manifest_publisher:
+        manifest_publisher.request()
+    stats_cache.invalidate()
+
+
+async def _reload_posters() -> None:
+    """Перечитать все активные афиши из основной БД"""
+    global posters_loaded, poster_change_version
+    # Версию читаем до афиш: изменение между запросами придёт уведомлением и
+    # поднимет её, а версия не окажется новее прочитанного списка
+    sequence_version = await get_poster_change_version(db_pool.primary)
+    rows = await get_active_posters(db_pool.primary)
+    poster_cache.replace_all(rows)
+    poster_change_version = max([poster_change_version, sequence_version, *(row['version'] for row in rows)])
+    posters_loaded = True
+    logger.info("Loaded %d active posters into cache", len(poster_cache))
+    _posters_changed()
+    # Уведомления во время разрыва потеряны: клиенты перечитают список целиком
+    poster_events.publish({"op": "resync"})
+
+
+async def _apply_poster_change(event: dict) -> None:
+    """Обновить кеш афиш по уведомлению {"id", "version", "op"}"""
+    global poster_change_version
+    poster_id = event["id"]
+    cached = poster_cache.get(poster_id)
+    if cached and cached['version'] >= event["version"]:
+        return
+    row = None
+    if event["op"] != "delete":
+        # Читаем с основной БД: реплика может ещё не получить изменение
+        row = await db_get_poster_by_id(db_pool.primary, poster_id)
+    if row and row['is_active']:
+        poster_cache.upsert(row)
+        poster_events.publish({
+            "op": "update" if cached else "create",
+            "id": poster_id,
+            "version": row['version'],
+            "poster": _poster_for_web(row),
+        })
+    else:
+        # Удалённая или снятая афиша пропадает из сводки сразу, а не к полному пересчёту
+        attendance_rollup.drop_poster(poster_id)
+        if poster_cache.remove(poster_id) is not None:
+            poster_events.publish({"op": "delete", "id": poster_id, "version": event["version"]})
+    poster_change_version = max(poster_change_version, event["version"])
+    _posters_changed()
+
+
+async def require_admin_token(x_admin_token: str = Header(default="")) -> None:
+    """Проверка доступа к служебным эндпоинтам"""
+    if not API_ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin token not configured")
+    if x_admin_token != API_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Forbidden")
 
 
 # Модели данных
@@ -56,25 +185,45 @@ class PosterForWeb(BaseModel):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global db_pool
+    global db_pool, poster_listener, photo_cache, manifest_publisher
     try:
-        db_pool = await asyncpg.create_pool(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            min_size=1,
-            max_size=10,
-        )
+        db_pool = await create_pool()
+        db_pool.observe_acquire(_observe_pool_acquire)
         logger.info("Database pool created successfully")
     except Exception as e:
         logger.error(f"Failed to create database pool: {e}")
         raise
     
+    stats_cache.start()
+    manifest_publisher = ManifestPublisher(lambda: (poster_change_version, _get_posters_snapshot().body))
+    manifest_publisher.start()
+    
+    poster_listener = PosterChangeListener(_apply_poster_change, on_reconnect=_reload_posters)
+    poster_listener.start()
+    # Афиши загружает сам слушатель после LISTEN; без него читаем их напрямую
+    if not await poster_listener.wait_ready():
+        try:
+            await _reload_posters()
+        except Exception as e:
+            logger.error(f"Failed to load posters: {e}")
+    
+    if BOT_TOKEN:
+        photo_cache = TelegramPhotoCache(BOT_TOKEN)
+        await photo_cache.start()
+    
+    health_prober.start()
+    
     yield
     
     # Shutdown
+    await health_prober.stop()
+    if poster_listener:
+        await poster_listener.stop()
+    if manifest_publisher:
+        await manifest_publisher.stop()
+    await stats_cache.stop()
+    if photo_cache:
+        await photo_cache.close()
     if db_pool:
         await db_pool.close()
         logger.info("Database pool closed")
@@ -85,9 +234,15 @@ app = FastAPI(
     title="TusaBot API",
     description="API для получения афиш мероприятий",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+# Сжатие ответов brotli/gzip по Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+# Снаружи всех: время ответа включает сжатие
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Настройка CORS для доступа из веб-приложения
 app.add_middleware(
     CORSMiddleware,
@@ -116,242 +271,535 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Проверка здоровья API"""
+    """Проверка здоровья API (по результату фоновой проверки БД)"""
+    if not health_prober.is_ready():
+        # Текст ошибки только в логе пробера: /health открыт наружу через nginx
+        raise HTTPException(status_code=503, detail="Database connection failed")
+    return {"status": "healthy", "database": "connected"}
+
+
+@app.get("/health/live")
+async def liveness():
+    """Процесс жив и обслуживает event loop; никакого I/O"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Готовность принимать трафик по последним фоновым проверкам"""
+    ready = health_prober.is_ready()
+    content = {"status": "ready" if ready else "not_ready", "checks": health_prober.public_results()}
+    if not ready:
+        content["failing"] = health_prober.failing()
+    return ORJSONResponse(status_code=200 if ready else 503, content=content)
+
+
+def _local_photo_path(row: dict) -> Optional[str]:
+    """Веб-путь локальной копии фото (в старых афишах он лежит в file_id)"""
+    if row.get('photo_path'):
+        return row['photo_path']
+    file_id = row['file_id'] or ""
+    if file_id.startswith('/posters/') or file_id.startswith('posters/'):
+        return file_id
+    return None
+
+
+def _poster_for_web(row: dict) -> dict:
+    """Афиша в формате веб-приложения: title/subtitle из caption и URL фото"""
+    file_id = row['file_id']
+    local_photo = _local_photo_path(row)
+    
+    caption = row['caption'] or ""
+    lines = caption.split('\n', 1)
+    title = lines[0] if lines else "Мероприятие"
+    subtitle = lines[1] if len(lines) > 1 else ""
+    
+    # Формируем URL для фото: статический файл, если есть локальная копия
+    if local_photo:
+        # Убедимся что путь начинается с /
+        photo_url = local_photo if local_photo.startswith('/') else f'/{local_photo}'
+    else:
+        # Только Telegram file_id, используем прокси
+        photo_url = f"/photo/{file_id}"
+    
+    # Уменьшенные копии (JPEG и WebP) для <img srcset>, если фото уже обработано
+    variants = row.get('photo_variants') or []
+    
+    return {
+        "id": row['id'],
+        "file_id": file_id,
+        "photo_url": photo_url,
+        "photo_width": row.get('photo_width'),
+        "photo_height": row.get('photo_height'),
+        "photo_bytes": row.get('photo_bytes'),
+        "srcset": ", ".join(f"{v['jpeg']} {v['width']}w" for v in variants),
+        "srcset_webp": ", ".join(f"{v['webp']} {v['width']}w" for v in variants),
+        "caption": caption,
+        "title": title,
+        "subtitle": subtitle,
+        "ticket_url": row['ticket_url'],
+        "created_at": row['created_at'].isoformat(),
+        "is_active": row['is_active']
+    }
+
+
+async def _ensure_posters_loaded() -> None:
+    """Догрузить кеш афиш, если при старте БД была недоступна"""
+    if posters_loaded:
+        return
     if not db_pool:
-        raise HTTPException(status_code=503, detail="Database pool not initialized")
+        raise HTTPException(status_code=503, detail="Database not available")
+    try:
+        await _reload_posters()
+    except Exception as e:
+        logger.error(f"Failed to load posters: {e}")
+        raise HTTPException(status_code=503, detail="Posters not loaded")
+
+
+# Клиент может хранить ответ, но обязан перепроверить его по ETag
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# Поля афиши, которые можно запросить через /posters?fields=...
+POSTER_WEB_FIELDS = frozenset((
+    "id", "file_id", "photo_url", "photo_width", "photo_height", "photo_bytes",
+    "srcset", "srcset_webp", "caption", "title", "subtitle", "ticket_url",
+    "created_at", "is_active",
+))
+
+
+class PostersSnapshot(NamedTuple):
+    """Готовый ответ /posters и /posters/latest для одной версии хранилища афиш"""
+    version: int
+    etag: str
+    last_modified: str
+    body: bytes
+    latest_body: Optional[bytes]
+    # Строки и отрисованные афиши в порядке ответа: (created_at, id) по убыванию
+    rows: list
+    items: list
+    # Ключи (created_at, id) по возрастанию — для bisect по курсору
+    keys_ascending: list
+
+
+_posters_snapshot: Optional[PostersSnapshot] = None
+
+
+def _get_posters_snapshot() -> PostersSnapshot:
+    """Отрисованный список афиш; пересобирается только после изменения хранилища"""
+    global _posters_snapshot
+    if _posters_snapshot is None or _posters_snapshot.version != poster_cache.version:
+        # Один порядок для всех ответов: как в БД и в курсорах страниц
+        rows = sorted(poster_cache, key=lambda row: (row['created_at'], row['id']), reverse=True)
+        rendered = [_poster_for_web(row) for row in rows]
+        # Версии строк берутся из общей последовательности БД, поэтому
+        # ETag совпадает во всех процессах API с одинаковым набором афиш
+        max_version = max((row['version'] for row in rows), default=0)
+        updated = [row['updated_at'] or row['created_at'] for row in rows]
+        _posters_snapshot = PostersSnapshot(
+            version=poster_cache.version,
+            etag=f'W/"posters-{len(rows)}-{max_version}"',
+            last_modified=format_datetime(max(updated), usegmt=True) if updated else "",
+            body=orjson.dumps(rendered),
+            latest_body=orjson.dumps(rendered[0]) if rendered else None,
+            rows=rows,
+            items=rendered,
+            keys_ascending=[(row['created_at'], row['id']) for row in reversed(rows)],
+        )
+    return _posters_snapshot
+
+
+def _poster_etag(row: dict) -> tuple[str, str]:
+    """ETag и Last-Modified одной афиши по версии строки"""
+    modified = row['updated_at'] or row['created_at']
+    return f'W/"poster-{row["id"]}-{row["version"]}"', format_datetime(modified, usegmt=True)
+
+
+def _is_not_modified(request: Request, etag: str) -> bool:
+    """Совпадает ли If-None-Match с текущим ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+def _validator_headers(etag: str, last_modified: str) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return headers
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[frozenset]:
+    """Разобрать ?fields=id,title,... Бросает 400 для неизвестных полей"""
+    if not fields:
+        return None
+    names = frozenset(name.strip() for name in fields.split(",") if name.strip())
+    unknown = names - POSTER_WEB_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return names
+
+
+def _pick_fields(item: dict, names: Optional[frozenset]) -> dict:
+    if names is None:
+        return item
+    return {key: value for key, value in item.items() if key in names}
+
+
+async def _posters_page(limit: int, cursor: Optional[str]) -> tuple[list, list, Optional[str]]:
+    """Страница активных афиш (строки, отрисованные афиши, next_cursor).
+
+    Из памяти, а если кеш не загружен — из БД по индексу.
+    """
+    try:
+        after = decode_keyset_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if posters_loaded:
+        snapshot = _get_posters_snapshot()
+        # Список идёт по убыванию ключа: пропускаем все ключи >= курсора
+        start = 0
+        if after is not None:
+            start = len(snapshot.keys_ascending) - bisect_left(snapshot.keys_ascending, after)
+        end = start + limit
+        next_cursor = None
+        if end < len(snapshot.rows):
+            last = snapshot.rows[end - 1]
+            next_cursor = encode_keyset_cursor(last['created_at'], last['id'])
+        return snapshot.rows[start:end], snapshot.items[start:end], next_cursor
     
+    if not db_pool:
+        raise HTTPException(status_code=503, detail="Database not available")
     try:
-        async with db_pool.acquire() as conn:
-            await conn.fetchval("SELECT 1")
-        return {"status": "healthy", "database": "connected"}
+        page = await get_active_posters_page(db_pool, limit=limit, cursor=cursor)
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        raise HTTPException(status_code=503, detail=f"Database connection failed: {str(e)}")
+        logger.error(f"Failed to fetch posters page: {e}")
+        raise HTTPException(status_code=503, detail="Posters not loaded")
+    return page["items"], [_poster_for_web(row) for row in page["items"]], page["next_cursor"]
+
+
+def _page_etag(rows: list, next_cursor: Optional[str], fields: Optional[str]) -> str:
+    """ETag страницы по id и версиям её афиш, курсору следующей страницы и набору полей"""
+    digest = hashlib.sha1(orjson.dumps([
+        [[row['id'], row['version']] for row in rows], next_cursor, fields,
+    ])).hexdigest()[:20]
+    return f'W/"posters-page-{digest}"'
+
+
+@app.get("/posters", dependencies=[Depends(posters_limiter)])
+async def get_posters(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Получить активные афиши.
+
+    Без limit/cursor — весь список. С ними — страница {"items", "next_cursor"}
+    по ключу (created_at, id), новые первыми. fields=id,title,... оставляет
+    в афишах только перечисленные поля.
+    """
+    field_names = _parse_fields(fields)
+    
+    if limit is not None or cursor is not None:
+        rows, items, next_cursor = await _posters_page(limit or POSTERS_PAGE_SIZE, cursor)
+        headers = {"ETag": _page_etag(rows, next_cursor, fields), "Cache-Control": REVALIDATE_CACHE_CONTROL}
+        if _is_not_modified(request, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        page = {"items": [_pick_fields(item, field_names) for item in items], "next_cursor": next_cursor}
+        return Response(content=orjson.dumps(page), media_type="application/json", headers=headers)
+    
+    await _ensure_posters_loaded()
+    
+    snapshot = _get_posters_snapshot()
+    headers = _validator_headers(snapshot.etag, snapshot.last_modified)
+    if _is_not_modified(request, snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    if field_names is None:
+        body = snapshot.body
+    else:
+        body = orjson.dumps([_pick_fields(item, field_names) for item in snapshot.items])
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/posters/latest", dependencies=[Depends(posters_limiter)])
+async def get_latest_poster(request: Request):
+    """Получить последнюю активную афишу"""
+    await _ensure_posters_loaded()
+    
+    snapshot = _get_posters_snapshot()
+    if not snapshot.rows:
+        raise HTTPException(status_code=404, detail="No active posters found")
+    headers = _validator_headers(*_poster_etag(snapshot.rows[0]))
+    if _is_not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.latest_body, media_type="application/json", headers=headers)
 
 
-@app.get("/posters")
-async def get_posters():
-    """Получить все активные афиши"""
+async def _poster_event_stream(queue: asyncio.Queue):
+    """Поток SSE: событие ready при подключении, дальше изменения афиш"""
+    try:
+        yield b"retry: 5000\nevent: ready\ndata: {}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Комментарий не даёт прокси закрыть простаивающее соединение
+                yield b": keepalive\n\n"
+                continue
+            yield b"event: " + event["op"].encode() + b"\ndata: " + orjson.dumps(event) + b"\n\n"
+    finally:
+        poster_events.unsubscribe(queue)
+
+
+@app.get("/posters/events")
+async def stream_poster_events():
+    """Server-Sent Events: create/update/delete афиш и resync, когда нужно перечитать список"""
+    return StreamingResponse(
+        _poster_event_stream(poster_events.subscribe()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/posters/{name}.{ext}")
+async def get_poster_file(name: str, ext: str):
+    """Файл фото афиши. Имена с хешем содержимого кешируются на год"""
+    filename = f"{name}.{ext}"
+    path = POSTERS_DIR / filename
+    if filename.startswith(".") or not path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    cache_control = IMMUTABLE_CACHE_CONTROL if is_content_addressed(filename) else "public, max-age=86400"
+    return FileResponse(path, headers={"Cache-Control": cache_control})
+
+
+def _poster_response(row: dict) -> dict:
+    """Афиша в формате /posters/{poster_id}"""
+    return {
+        "id": row['id'],
+        "file_id": row['file_id'],
+        "caption": row['caption'],
+        "ticket_url": row['ticket_url'],
+        "created_at": row['created_at'].isoformat(),
+        "is_active": row['is_active']
+    }
+
+
+@app.get("/posters/batch", dependencies=[Depends(posters_limiter)])
+async def get_posters_batch(ids: str = Query(..., description="ID афиш через запятую")):
+    """Получить несколько афиш за один запрос, в порядке ids.
+
+    Активные афиши берутся из кеша, остальные — одним запросом к БД.
+    Ненайденные ID перечисляются в missing.
+    """
+    try:
+        # dict.fromkeys убирает повторы, сохраняя порядок
+        poster_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not poster_ids:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    if len(poster_ids) > POSTERS_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {POSTERS_BATCH_MAX_IDS} ids per request")
+    
+    rows = {poster_id: poster_cache.get(poster_id) for poster_id in poster_ids}
+    uncached = [poster_id for poster_id, row in rows.items() if row is None]
+    if uncached:
+        if not db_pool:
+            raise HTTPException(status_code=503, detail="Database not available")
+        try:
+            for row in await get_posters_by_ids(db_pool, uncached):
+                rows[row['id']] = row
+        except Exception as e:
+            logger.error(f"Failed to fetch posters {uncached}: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return {
+        "items": [_poster_response(rows[poster_id]) for poster_id in poster_ids if rows[poster_id]],
+        "missing": [poster_id for poster_id in poster_ids if not rows[poster_id]],
+    }
+
+
+@app.get("/posters/{poster_id}", dependencies=[Depends(posters_limiter)])
+async def get_poster(poster_id: int, request: Request, response: Response):
+    """Получить афишу по ID"""
+    row = poster_cache.get(poster_id)
+    if row is None:
+        # В кеше только активные афиши, неактивные читаем из БД
+        if not db_pool:
+            raise HTTPException(status_code=503, detail="Database not available")
+        try:
+            row = await db_get_poster_by_id(db_pool, poster_id)
+        except Exception as e:
+            logger.error(f"Failed to fetch poster {poster_id}: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="Poster not found")
+    
+    # Для активных афиш из кеша перепроверка обходится без обращения к БД
+    headers = _validator_headers(*_poster_etag(row))
+    if _is_not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return _poster_response(row)
+
+
+@app.get("/stats")
+async def get_stats():
+    """Получить общую статистику (снимок, age_seconds — его возраст)"""
     if not db_pool:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        async with db_pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT id, file_id, caption, ticket_url, created_at, is_active
-                FROM posters
-                WHERE is_active = true
-                ORDER BY created_at DESC
-                """
-            )
-            
-            posters = []
-            for row in rows:
-                file_id = row['file_id']
-                # Проверяем, является ли file_id локальным путем к файлу
-                is_local_file = file_id.startswith('/posters/') or file_id.startswith('posters/')
-                
-                caption = row['caption'] or ""
-                lines = caption.split('\n', 1)
-                title = lines[0] if lines else "Мероприятие"
-                subtitle = lines[1] if len(lines) > 1 else ""
-                
-                # Формируем URL для фото
-                if is_local_file:
-                    # Убедимся что путь начинается с /
-                    photo_url = file_id if file_id.startswith('/') else f'/{file_id}'
-                else:
-                    # Это Telegram file_id, используем прокси
-                    photo_url = f"/photo/{file_id}"
-                
-                posters.append({
-                    "id": row['id'],
-                    "file_id": file_id,
-                    "photo_url": photo_url,
-                    "caption": caption,
-                    "title": title,
-                    "subtitle": subtitle,
-                    "ticket_url": row['ticket_url'],
-                    "created_at": row['created_at'].isoformat(),
-                    "is_active": row['is_active']
-                })
-            
-            return posters
+        return await stats_cache.get()
     except Exception as e:
-        logger.error(f"Failed to fetch posters: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Failed to fetch stats: {e}")
+        raise HTTPException(status_code=503, detail="Stats not available")
 
 
-@app.get("/posters/latest")
-async def get_latest_poster():
-    """Получить последнюю активную афишу"""
+@app.get("/attendance/rollup", dependencies=[Depends(require_admin_token)])
+async def get_attendance_rollup():
+    """Сводка посещаемости по всем афишам (из кеша)"""
     if not db_pool:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        async with db_pool.acquire() as conn:
-            row = await conn.fetchrow(
-                """
-                SELECT id, file_id, caption, ticket_url, created_at, is_active
-                FROM posters
-                WHERE is_active = true
-                ORDER BY created_at DESC
-                LIMIT 1
-                """
-            )
-            
-            if not row:
-                raise HTTPException(status_code=404, detail="No active posters found")
-            
-            # Парсим caption для разделения на title и subtitle
-            caption = row['caption'] or ""
-            lines = caption.split('\n', 1)
-            title = lines[0] if lines else "Мероприятие"
-            subtitle = lines[1] if len(lines) > 1 else ""
-            
-            # file_id теперь может быть путем к файлу (/posters/poster_123.jpg) или Telegram file_id
-            file_id = row['file_id']
-            is_local_file = file_id.startswith('/posters/') or file_id.startswith('posters/')
-            
-            # Формируем URL для фото
-            if is_local_file:
-                photo_url = file_id if file_id.startswith('/') else f'/{file_id}'
-            else:
-                photo_url = f"/photo/{file_id}"
-            
-            return {
-                "id": row['id'],
-                "file_id": file_id,
-                "photo_url": photo_url,
-                "caption": caption,
-                "title": title,
-                "subtitle": subtitle,
-                "ticket_url": row['ticket_url'],
-                "created_at": row['created_at'].isoformat(),
-                "is_active": row['is_active']
-            }
-    except HTTPException:
-        raise
+        rollup = await attendance_rollup.get(db_pool)
+        return [
+            {"poster_id": poster_id, **counters}
+            for poster_id, counters in sorted(rollup.items())
+        ]
     except Exception as e:
-        logger.error(f"Failed to fetch latest poster: {e}")
+        logger.error(f"Failed to fetch attendance rollup: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/posters/{poster_id}")
-async def get_poster(poster_id: int):
-    """Получить афишу по ID"""
+@app.get("/posters/{poster_id}/attendances", dependencies=[Depends(require_admin_token)])
+async def get_poster_attendances(
+    poster_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+):
+    """Посетители мероприятия постранично (курсор из next_cursor)"""
     if not db_pool:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        async with db_pool.acquire() as conn:
-            row = await conn.fetchrow(
-                """
-                SELECT id, file_id, caption, ticket_url, created_at, is_active
-                FROM posters
-                WHERE id = $1
-                """,
-                poster_id
-            )
-            
-            if not row:
-                raise HTTPException(status_code=404, detail="Poster not found")
-            
-            return {
-                "id": row['id'],
-                "file_id": row['file_id'],
-                "caption": row['caption'],
-                "ticket_url": row['ticket_url'],
-                "created_at": row['created_at'].isoformat(),
-                "is_active": row['is_active']
-            }
-    except HTTPException:
-        raise
+        page = await get_poster_attendances_page(db_pool, poster_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Failed to fetch poster {poster_id}: {e}")
+        logger.error(f"Failed to fetch attendances for poster {poster_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    for item in page["items"]:
+        item["attended_at"] = item["attended_at"].isoformat()
+    return page
 
 
-@app.get("/stats")
-async def get_stats():
-    """Получить общую статистику"""
+@app.get("/users/{tg_id}/attendances", dependencies=[Depends(require_admin_token)])
+async def get_user_attendances(
+    tg_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+):
+    """История посещений пользователя постранично (курсор из next_cursor)"""
     if not db_pool:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        async with db_pool.acquire() as conn:
-            # Статистика пользователей
-            user_stats = await conn.fetchrow("""
-                SELECT 
-                    COUNT(*) as total_users,
-                    COUNT(vk_id) as users_with_vk,
-                    COUNT(CASE WHEN gender = 'male' THEN 1 END) as male_users,
-                    COUNT(CASE WHEN gender = 'female' THEN 1 END) as female_users
-                FROM users
-            """)
-            
-            # Статистика афиш
-            poster_stats = await conn.fetchrow("""
-                SELECT 
-                    COUNT(*) as total_posters,
-                    COUNT(CASE WHEN is_active = true THEN 1 END) as active_posters
-                FROM posters
-            """)
-            
-            return {
-                "users": {
-                    "total": user_stats['total_users'],
-                    "with_vk": user_stats['users_with_vk'],
-                    "male": user_stats['male_users'],
-                    "female": user_stats['female_users']
-                },
-                "posters": {
-                    "total": poster_stats['total_posters'],
-                    "active": poster_stats['active_posters']
-                }
-            }
+        page = await get_user_attendances_page(db_pool, tg_id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Failed to fetch stats: {e}")
+        logger.error(f"Failed to fetch attendances for user {tg_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    for item in page["items"]:
+        item["attended_at"] = item["attended_at"].isoformat()
+    return page
 
 
-@app.get("/photo/{file_id}")
+@app.get("/photo/{file_id}", dependencies=[Depends(photo_limiter)])
 async def get_photo(file_id: str):
     """Получить фото афиши через Telegram Bot API"""
-    if not BOT_TOKEN:
+    # Старые клиенты запрашивают фото по file_id: отдаём локальную копию, если она есть
+    for row in poster_cache:
+        if row['file_id'] == file_id and _local_photo_path(row):
+            path = local_path(_local_photo_path(row))
+            if path.is_file():
+                return FileResponse(path, headers={"Cache-Control": "public, max-age=86400"})
+            break
+    
+    if not photo_cache:
         raise HTTPException(status_code=503, detail="Bot token not configured")
     
     try:
-        # Получаем информацию о файле
-        async with httpx.AsyncClient() as client:
-            file_info_url = f"https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={file_id}"
-            file_response = await client.get(file_info_url)
-            file_data = file_response.json()
-            
-            if not file_data.get("ok"):
-                raise HTTPException(status_code=404, detail="File not found")
-            
-            file_path = file_data["result"]["file_path"]
-            
-            # Скачиваем файл
-            file_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-            photo_response = await client.get(file_url)
-            
-            if photo_response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Failed to download photo")
-            
-            # Возвращаем фото
-            return StreamingResponse(
-                iter([photo_response.content]),
-                media_type="image/jpeg",
-                headers={"Cache-Control": "public, max-age=86400"}  # Кеш на 24 часа
-            )
-    except HTTPException:
-        raise
+        path = await photo_cache.get(file_id)
+        if not path.exists():
+            # Файл вытеснили между get() и ответом: скачиваем заново
+            path = await photo_cache.get(file_id)
+    except PhotoNotFound:
+        raise HTTPException(status_code=404, detail="File not found")
     except Exception as e:
         logger.error(f"Failed to get photo {file_id}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=502, detail="Failed to download photo")
+    
+    if PHOTO_CACHE_ACCEL_PREFIX:
+        # Файл отдаёт nginx через sendfile, воркер только называет его
+        return Response(
+            media_type="image/jpeg",
+            headers={
+                "X-Accel-Redirect": PHOTO_CACHE_ACCEL_PREFIX + path.name,
+                "Cache-Control": "public, max-age=86400",
+            },
+        )
+    
+    # FileResponse отдаёт файл с диска кусками, не читая его целиком в память
+    return FileResponse(
+        path,
+        media_type="image/jpeg",
+        headers={"Cache-Control": "public, max-age=86400"}  # Кеш на 24 часа
+    )
+
+def _observe_pool_acquire(pool_name: str, seconds: float) -> None:
+    metrics.DB_POOL_ACQUIRE_SECONDS.observe(seconds, (pool_name,))
+
+
+def _read_pool_sizes():
+    if not db_pool:
+        return
+    for name, pool in (("primary", db_pool.primary), ("replica", db_pool.replica)):
+        if pool is not None:
+            yield (name, "size"), pool.get_size()
+            yield (name, "idle"), pool.get_idle_size()
+            yield (name, "max"), pool.get_max_size()
+
+
+def _read_photo_cache():
+    if photo_cache:
+        yield ("hit",), photo_cache.hits
+        yield ("miss",), photo_cache.misses
+
+
+metrics.CallbackMetric(
+    "tusabot_db_pool_connections", "Соединения в пуле asyncpg", "gauge", ("pool", "state"), _read_pool_sizes,
+)
+metrics.CallbackMetric(
+    "tusabot_photo_cache_requests_total", "Обращения к дисковому кешу фото", "counter", ("result",),
+    _read_photo_cache,
+)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 if __name__ == "__main__":
@@ -29,9 +29,11 @@ from telegram import (
     ReplyKeyboardRemove,
     BotCommand,
     WebAppInfo,
+    InputMediaPhoto,
 )
 from telegram.constants import ChatMemberStatus
-from telegram.error import Forbidden
+from telegram.error import BadRequest, Forbidden
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     Application,
     ApplicationBuilder,
@@ -47,11 +49,19 @@ from telegram.ext import (
 from telegram.request import HTTPXRequest
 from db import (
     create_pool, init_schema, upsert_user, get_user, get_user_by_username, 
-    get_all_user_ids, get_user_stats, export_users_to_excel,
+    get_all_user_ids, get_user_stats, export_users_to_excel, export_users_to_csv,
     create_poster, get_active_posters, get_latest_poster, get_poster_by_id,
-    deactivate_poster, delete_poster as db_delete_poster, update_poster_ticket_url,
-    mark_attendance, get_user_attendances, get_poster_attendances, get_attendance_stats
+    deactivate_poster, delete_poster as db_delete_poster, update_poster_ticket_url, set_poster_images,
+    mark_attendance, get_user_attendances, get_poster_attendances, get_attendance_stats,
+    get_poster_attendances_page
 )
+from checkin import AttendanceQueue, InvalidCheckinToken, issue_checkin_token, verify_checkin_token
+from poster_events import PosterChangeListener
+from poster_images import PosterImagePipeline
+from poster_storage import release_poster_files, save_poster_bytes
+from poster_store import PosterStore
+from health import HEALTH_PROBE_SECONDS, HealthProber, write_heartbeat
+from rollups import AttendanceRollup
 
 # ----------------------
 # Logging
@@ -121,6 +131,12 @@ WEEKLY_MINUTE = int(_get_env("WEEKLY_MINUTE", "0"))
 PROXY_URL = _get_env("PROXY_URL", "")
 # Convert MSK (UTC+3) local hour to UTC for job queue
 WEEKLY_HOUR_UTC = (WEEKLY_HOUR_LOCAL - 3) % 24
+# Размер страницы списка посетителей в админ-панели
+ATTENDEES_PAGE_SIZE = 20
+# Сколько последних афиш показывать в сводке посещаемости (лимит сообщения — 4096 символов)
+ATTENDANCE_SUMMARY_POSTERS = 10
+# Как часто записывать накопленные чек-ины в БД (секунды)
+CHECKIN_FLUSH_SECONDS = int(_get_env("CHECKIN_FLUSH_SECONDS", "10"))
 
 logger.info("Loaded .env from: %s", _DOTENV_PATH)
 
@@ -204,6 +220,76 @@ def get_known_users(context: ContextTypes.DEFAULT_TYPE) -> Set[int]:
     return bd["known_users"]
 
 
+def get_checkin_queue(context: ContextTypes.DEFAULT_TYPE) -> AttendanceQueue:
+    bd = context.bot_data
+    if "checkin_queue" not in bd:
+        bd["checkin_queue"] = AttendanceQueue()
+    return bd["checkin_queue"]
+
+
+def get_attendance_rollup(context: ContextTypes.DEFAULT_TYPE) -> AttendanceRollup:
+    bd = context.bot_data
+    if "attendance_rollup" not in bd:
+        bd["attendance_rollup"] = AttendanceRollup()
+    return bd["attendance_rollup"]
+
+
+def get_image_pipeline(context: ContextTypes.DEFAULT_TYPE) -> PosterImagePipeline:
+    bd = context.bot_data
+    if "image_pipeline" not in bd:
+        bd["image_pipeline"] = PosterImagePipeline()
+    return bd["image_pipeline"]
+
+
+async def attach_poster_images(context: ContextTypes.DEFAULT_TYPE, poster_id: int, photo_path: str) -> None:
+    """Дождаться нарезки фото и записать размеры и варианты в афишу"""
+    images = await get_image_pipeline(context).result(photo_path)
+    pool = get_db_pool(context)
+    if not images or not pool:
+        return
+    try:
+        await set_poster_images(pool, poster_id, images["width"], images["height"], images["variants"])
+        logger.info("Poster %s: saved %d image variants", poster_id, len(images["variants"]))
+    except Exception as e:
+        logger.warning("Failed to save image variants for poster %s: %s", poster_id, e)
+
+
+def pending_poster_photos(context: ContextTypes.DEFAULT_TYPE) -> set[str]:
+    """Фото черновиков, ещё не сохранённых в БД: их файлы удалять нельзя"""
+    paths = get_image_pipeline(context).in_flight()
+    for data in context.application.user_data.values():
+        draft = data.get("poster_draft")
+        if draft and draft.get("photo_path"):
+            paths.add(draft["photo_path"])
+    return paths
+
+
+async def discard_draft_photo(context: ContextTypes.DEFAULT_TYPE, photo_path: str) -> None:
+    """Удалить файлы фото отменённого черновика, если на них никто не ссылается"""
+    drafts = {
+        data["poster_draft"].get("photo_path")
+        for data in context.application.user_data.values()
+        if data.get("poster_draft")
+    }
+    if photo_path in drafts:
+        # То же фото в черновике другого админа: его нарезка ещё понадобится
+        return
+    # Ждём окончания нарезки, чтобы варианты не появились на диске после удаления
+    images = await get_image_pipeline(context).result(photo_path)
+    pool = get_db_pool(context)
+    if not pool:
+        return
+    try:
+        await release_poster_files(
+            pool,
+            photo_path,
+            images["variants"] if images else None,
+            pending=pending_poster_photos(context),
+        )
+    except Exception as e:
+        logger.warning("Failed to release draft photo %s: %s", photo_path, e)
+
+
 def get_db_pool(context: ContextTypes.DEFAULT_TYPE):
     try:
         return context.application.bot_data.get("db_pool")
@@ -211,6 +297,84 @@ def get_db_pool(context: ContextTypes.DEFAULT_TYPE):
         return None
 
 
+def poster_from_row(row: dict, existing: Optional[dict] = None) -> dict:
+    """Афиша из строки БД в формате bot_data"""
+    poster = {
+        "id": row["id"],
+        "file_id": row["file_id"],
+        "caption": row["caption"],
+        "ticket_url": row["ticket_url"],
+        "version": row["version"],
+        "photo_path": row.get("photo_path"),
+    }
+    # В старых афишах в file_id лежит путь к локальному файлу: переносим его в photo_path,
+    # а Telegram file_id оставляем прежним, если бот его знает
+    file_id = row["file_id"] or ""
+    if file_id.startswith("/posters/") or file_id.startswith("posters/"):
+        poster["photo_path"] = poster["photo_path"] or file_id
+        poster["file_id"] = (existing or {}).get("file_id") or file_id
+    return poster
+
+
+def get_poster_store(context: ContextTypes.DEFAULT_TYPE) -> PosterStore:
+    bd = context.bot_data
+    if "posters" not in bd:
+        bd["posters"] = PosterStore()
+    return bd["posters"]
+
+
+def set_poster_cursor(context: ContextTypes.DEFAULT_TYPE, poster_id: int) -> None:
+    """Запомнить афишу пользователя вместе с версией публикации хранилища"""
+    context.user_data["poster_cursor"] = {
+        "poster_id": poster_id,
+        "version": get_poster_store(context).published_version,
+    }
+
+
+def get_current_poster(context: ContextTypes.DEFAULT_TYPE) -> Optional[dict]:
+    """Афиша, которую сейчас листает пользователь (по умолчанию — самая новая).
+
+    Курсор сверяется с хранилищем лениво: если после его сохранения вышла
+    новая афиша, пользователь возвращается к ней.
+    """
+    store = get_poster_store(context)
+    cursor = context.user_data.get("poster_cursor")
+    if cursor and cursor["version"] >= store.published_version:
+        poster = store.nearest(cursor["poster_id"])
+    else:
+        poster = store.latest()
+    if poster:
+        set_poster_cursor(context, poster["id"])
+    return poster
+
+
+async def reload_posters(app: Application) -> None:
+    """Перечитать активные афиши из БД в хранилище bot_data["posters"]"""
+    pool = app.bot_data["db_pool"]
+    posters_from_db = await get_active_posters(pool.primary)
+    store = app.bot_data.setdefault("posters", PosterStore())
+    store.replace_all(poster_from_row(p, store.get(p["id"])) for p in posters_from_db)
+    logger.info("Loaded %d active posters from DB", len(store))
+
+
+async def apply_poster_change(app: Application, event: dict) -> None:
+    """Обновить хранилище афиш по уведомлению {"id", "version", "op"}"""
+    poster_id = event["id"]
+    store = app.bot_data.setdefault("posters", PosterStore())
+    existing = store.get(poster_id)
+    if existing and existing.get("version", 0) >= event["version"]:
+        return
+    
+    row = None
+    if event["op"] != "delete":
+        row = await get_poster_by_id(app.bot_data["db_pool"].primary, poster_id)
+    
+    if row and row["is_active"]:
+        store.upsert(poster_from_row(row, existing))
+    else:
+        store.remove(poster_id)
+
+
 async def load_user_data_from_db(context: ContextTypes.DEFAULT_TYPE, user_id: int):
     """Загружает данные пользователя из БД в context.user_data"""
     logger.info("=== LOAD_USER_DATA_FROM_DB START ===")
@@ -460,6 +624,84 @@ async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await show_main_menu(update, context)
 
 
+def poster_caption(context: ContextTypes.DEFAULT_TYPE, poster: dict) -> str:
+    """Подпись афиши с номером в списке"""
+    store = get_poster_store(context)
+    caption = poster.get("caption", "")
+    if len(store) > 1:
+        caption += f"\n\n📍 Афиша {store.index(poster['id']) + 1} из {len(store)}"
+    return caption
+
+
+def poster_buttons(context: ContextTypes.DEFAULT_TYPE, user_id: int, poster: dict) -> list:
+    """Кнопки навигации и действий под афишей"""
+    store = get_poster_store(context)
+    nav_buttons = []
+    
+    # Навигация по афишам (если больше одной): кнопки ссылаются на id соседних афиш
+    if len(store) > 1:
+        nav_row = []
+        prev_id, next_id = store.neighbours(poster["id"])
+        if prev_id is not None:
+            nav_row.append(InlineKeyboardButton("⬅️ Предыдущая", callback_data=f"poster:{prev_id}"))
+        if next_id is not None:
+            nav_row.append(InlineKeyboardButton("➡️ Следующая", callback_data=f"poster:{next_id}"))
+        if nav_row:
+            nav_buttons.append(nav_row)
+    
+    # Основные кнопки действий в правильном порядке
+    action_buttons = []
+    
+    # 1. Кнопка билетов (если есть ссылка)
+    if poster.get("ticket_url"):
+        action_buttons.append([InlineKeyboardButton("🎫 Купить билет", url=poster["ticket_url"])])
+    
+    # 2. Код для прохода на входе
+    if poster.get("id"):
+        action_buttons.append([InlineKeyboardButton("🎟 Код для входа", callback_data=f"checkin:{poster['id']}")])
+    
+    # Админские кнопки
+    if user_id in get_admins(context):
+        admin_row = []
+        admin_row.append(InlineKeyboardButton("🛠 Админ-панель", callback_data="open_admin"))
+        admin_row.append(InlineKeyboardButton("🗑 Удалить", callback_data=f"delete_poster:{poster['id']}"))
+        action_buttons.append(admin_row)
+    
+    return nav_buttons + action_buttons
+
+
+async def show_poster_in_place(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показать текущую афишу пользователя, отредактировав сообщение с нажатой кнопкой.
+
+    Один вызов editMessageMedia вместо удаления сообщения и повторной отправки
+    через show_main_menu. К пересылке возвращаемся, только если сообщение
+    нельзя отредактировать (например, это текст, а не фото).
+    """
+    query = update.callback_query
+    poster = get_current_poster(context)
+    file_id = poster.get("file_id") if poster else None
+    message = query.message
+    
+    if message and message.photo and file_id and not file_id.startswith("/"):
+        try:
+            await query.edit_message_media(
+                media=InputMediaPhoto(media=file_id, caption=poster_caption(context, poster)),
+                reply_markup=InlineKeyboardMarkup(poster_buttons(context, query.from_user.id, poster)),
+            )
+            return
+        except BadRequest as e:
+            # Повторное нажатие на ту же афишу — менять нечего
+            if "message is not modified" in str(e).lower():
+                return
+            logger.warning("Failed to edit poster message in place, resending: %s", e)
+    
+    try:
+        await message.delete()
+    except Exception:
+        pass
+    await show_main_menu(update, context)
+
+
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показать главное меню с текущей афишей и навигацией"""
     user = update.effective_user
@@ -488,16 +730,10 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
     
-    # Получаем все афиши
-    all_posters = context.bot_data.get("all_posters", [])
-    current_poster = context.bot_data.get("poster")
+    # Текущая афиша пользователя (по умолчанию - последняя)
+    poster = get_current_poster(context)
     
-    # Если есть текущая афиша, но её нет в списке всех афиш, добавляем
-    if current_poster and current_poster not in all_posters:
-        all_posters.append(current_poster)
-        context.bot_data["all_posters"] = all_posters
-    
-    if not all_posters:
+    if not poster:
         # Нет афиш - показываем заглушку
         kb = []
         if user.id in get_admins(context):
@@ -510,56 +746,11 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
     
-    # Получаем текущий индекс афиши (по умолчанию - последняя)
-    if "current_poster_index" not in context.user_data and all_posters:
-        context.user_data["current_poster_index"] = len(all_posters) - 1
-    current_poster_index = context.user_data.get("current_poster_index", 0)
-    if current_poster_index >= len(all_posters):
-        current_poster_index = len(all_posters) - 1
-        context.user_data["current_poster_index"] = current_poster_index
-    elif current_poster_index < 0:
-        current_poster_index = 0
-        context.user_data["current_poster_index"] = current_poster_index
-    
-    # Показываем текущую афишу
-    poster = all_posters[current_poster_index]
-    
-    # Создаем кнопки навигации и действий
-    nav_buttons = []
-    
-    # Навигация по афишам (если больше одной)
-    if len(all_posters) > 1:
-        nav_row = []
-        if current_poster_index > 0:
-            nav_row.append(InlineKeyboardButton("⬅️ Предыдущая", callback_data="poster_prev"))
-        if current_poster_index < len(all_posters) - 1:
-            nav_row.append(InlineKeyboardButton("➡️ Следующая", callback_data="poster_next"))
-        if nav_row:
-            nav_buttons.append(nav_row)
-    
-    # Основные кнопки действий в правильном порядке
-    action_buttons = []
-    
-    # 1. Кнопка билетов (если есть ссылка)
-    if poster.get("ticket_url"):
-        action_buttons.append([InlineKeyboardButton("🎫 Купить билет", url=poster["ticket_url"])])
-    
-    # Админские кнопки
-    if user and user.id in get_admins(context):
-        admin_row = []
-        admin_row.append(InlineKeyboardButton("🛠 Админ-панель", callback_data="open_admin"))
-        if len(all_posters) > 0:
-            admin_row.append(InlineKeyboardButton("🗑 Удалить", callback_data=f"delete_poster:{current_poster_index}"))
-        action_buttons.append(admin_row)
+    all_buttons = poster_buttons(context, user.id, poster)
     
-    # Собираем все кнопки
-    all_buttons = nav_buttons + action_buttons
-    
-    # Отправляем или редактируем афишу
+    # Отправляем афишу
     try:
-        caption = poster.get("caption", "")
-        if len(all_posters) > 1:
-            caption += f"\n\n📍 Афиша {current_poster_index + 1} из {len(all_posters)}"
+        caption = poster_caption(context, poster)
         
         file_id = poster.get("file_id")
         photo_path = poster.get("photo_path")
@@ -714,9 +905,7 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         elif data == "show_current_poster":
             # Показать актуальную афишу (последнюю)
-            all_posters = context.bot_data.get("all_posters", [])
-            if all_posters:
-                context.user_data["current_poster_index"] = len(all_posters) - 1
+            context.user_data.pop("poster_cursor", None)
             # UX: удаляем старое сообщение и отправляем новое фото афиши
             try:
                 await query.message.delete()
@@ -726,9 +915,7 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         elif data == "poster":
             # Показать актуальную афишу (последнюю) - для совместимости
-            all_posters = context.bot_data.get("all_posters", [])
-            if all_posters:
-                context.user_data["current_poster_index"] = len(all_posters) - 1
+            context.user_data.pop("poster_cursor", None)
             try:
                 await query.message.delete()
             except Exception:
@@ -744,44 +931,34 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await load_user_data_from_db(context, user.id)
             
             # Сбрасываем индекс афиши на последнюю (самую новую)
-            all_posters = context.bot_data.get("all_posters", [])
-            if all_posters:
-                context.user_data["current_poster_index"] = len(all_posters) - 1
-            try:
-                await query.message.delete()
-            except Exception:
-                pass
-            await show_main_menu(update, context)
+            context.user_data.pop("poster_cursor", None)
+            await show_poster_in_place(update, context)
         
-        elif data == "poster_prev":
-            # Переход к предыдущей афише
-            all_posters = context.bot_data.get("all_posters", [])
-            current_index = context.user_data.get("current_poster_index", len(all_posters) - 1 if all_posters else 0)
-            if current_index > 0:
-                context.user_data["current_poster_index"] = current_index - 1
-            try:
-                await query.message.delete()
-            except Exception:
-                pass
-            await show_main_menu(update, context)
+        elif data.startswith("poster:"):
+            # Переход к афише по id (кнопки навигации)
+            set_poster_cursor(context, int(data.split(":", 1)[1]))
+            await show_poster_in_place(update, context)
+        
+        elif data in ("poster_prev", "poster_next"):
+            # Навигация из сообщений, отправленных до перехода на кнопки с id
+            current = get_current_poster(context)
+            if current:
+                prev_id, next_id = get_poster_store(context).neighbours(current["id"])
+                target_id = prev_id if data == "poster_prev" else next_id
+                if target_id is not None:
+                    set_poster_cursor(context, target_id)
+            await show_poster_in_place(update, context)
         
         elif data.startswith("delete_poster:"):
-            # Удаление афиши по индексу из главного меню
+            # Удаление афиши по id из главного меню
             try:
-                poster_index = int(data.split(":", 1)[1])
-                all_posters = context.bot_data.get("all_posters", [])
+                poster_id = int(data.split(":", 1)[1])
+                poster = get_poster_store(context).get(poster_id)
                 
-                if poster_index < 0 or poster_index >= len(all_posters):
+                if not poster:
                     await query.answer("❌ Афиша не найдена")
                     return
                 
-                poster = all_posters[poster_index]
-                poster_id = poster.get("id")
-                
-                if not poster_id:
-                    await query.answer("❌ ID афиши не найден")
-                    return
-                
                 # Подтверждение удаления
                 await query.edit_message_caption(
                     caption=f"❓ Удалить эту афишу?\n\n{poster.get('caption', '')[:100]}...",
@@ -810,17 +987,6 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     await query.edit_message_text("❌ Афиша не найдена")
                     return
                 
-                # Удаляем фото из папки project/public/posters/
-                file_id = poster.get("file_id", "")
-                if file_id.startswith("/posters/") or file_id.startswith("posters/"):
-                    try:
-                        file_path = Path(__file__).parent / "project" / "public" / file_id.lstrip("/")
-                        if file_path.exists():
-                            file_path.unlink()
-                            logger.info(f"Deleted photo file: {file_path}")
-                    except Exception as e:
-                        logger.error(f"Failed to delete photo file: {e}")
-                
                 # Удаляем из БД
                 try:
                     await db_delete_poster(pool, poster_id)
@@ -830,23 +996,24 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     await query.edit_message_text(f"❌ Ошибка удаления из БД: {e}")
                     return
                 
-                # Обновляем локальный кэш
-                all_posters = context.bot_data.get("all_posters", [])
-                context.bot_data["all_posters"] = [p for p in all_posters if p.get("id") != poster_id]
+                # Удаляем фото из project/public/posters/, если другие афиши на него не ссылаются
+                try:
+                    await release_poster_files(
+                        pool,
+                        poster.get("photo_path") or poster.get("file_id", ""),
+                        poster.get("photo_variants"),
+                        pending=pending_poster_photos(context),
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to release photo files: {e}")
                 
-                current_poster = context.bot_data.get("poster")
-                if current_poster and current_poster.get("id") == poster_id:
-                    # Загружаем новую текущую афишу из БД
-                    active_posters = await get_active_posters(pool)
-                    if active_posters:
-                        context.bot_data["poster"] = active_posters[-1]
-                        context.bot_data["all_posters"] = active_posters
-                    else:
-                        context.bot_data.pop("poster", None)
-                        context.bot_data["all_posters"] = []
+                # Обновляем локальный кэш
+                get_attendance_rollup(context).drop_poster(poster_id)
+                store = get_poster_store(context)
+                store.remove(poster_id)
                     
                 caption = poster.get("caption", "Без описания")[:50]
-                remaining = len(context.bot_data.get("all_posters", []))
+                remaining = len(store)
                 
                 await query.edit_message_text(
                     f"✅ **Афиша удалена:**\n{caption}\n\n"
@@ -860,17 +1027,19 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         elif data == "cancel_delete":
             await query.edit_message_text("❌ Удаление отменено")
         
-        elif data == "poster_next":
-            # Переход к следующей афише
-            all_posters = context.bot_data.get("all_posters", [])
-            current_index = context.user_data.get("current_poster_index", len(all_posters) - 1 if all_posters else 0)
-            if current_index < len(all_posters) - 1:
-                context.user_data["current_poster_index"] = current_index + 1
-            try:
-                await query.message.delete()
-            except Exception:
-                pass
-            await show_main_menu(update, context)
+        elif data.startswith("checkin:"):
+            # Выдать подписанный код для прохода на мероприятие
+            poster_id = int(data.split(":", 1)[1])
+            token = issue_checkin_token(user.id, poster_id)
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text=(
+                    "🎟 **Ваш код для входа:**\n\n"
+                    f"`{token}`\n\n"
+                    "Покажите его на входе — проверка займёт секунду."
+                ),
+                parse_mode="Markdown"
+            )
         
         elif data.startswith("gender_"):
             # Обработка выбора пола
@@ -911,7 +1080,11 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             if sub == "create_poster":
                 # init draft
                 ud = context.user_data
+                previous = ud.get("poster_draft") or {}
                 ud["poster_draft"] = {"step": "photo", "file_id": None, "caption": None, "ticket_url": None}
+                if previous.get("photo_path"):
+                    # Брошенный черновик заменён новым: его фото больше не нужно
+                    context.application.create_task(discard_draft_photo(context, previous["photo_path"]))
                 await query.edit_message_text(
                     "Шаг 1/4: пришлите фото афиши",
                     reply_markup=InlineKeyboardMarkup([
@@ -989,7 +1162,9 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 await query.edit_message_text(f"Пользователей: {count}")
             
             elif sub == "back_to_panel":
-                context.user_data.pop("poster_draft", None)
+                draft = context.user_data.pop("poster_draft", None) or {}
+                if draft.get("photo_path"):
+                    context.application.create_task(discard_draft_photo(context, draft["photo_path"]))
                 await admin_panel(update, context)
             
             elif sub == "confirm_poster":
@@ -1007,24 +1182,33 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     await query.edit_message_text("❌ Некорректная ссылка на билеты. Укажите URL формата https://...")
                     return
                 
-                # Сохраняем афишу в БД (теперь с путем к фото)
+                # Сохраняем афишу в БД (теперь с путем к фото): без id афишу нельзя листать
                 pool = get_db_pool(context)
-                poster_id = None
-                if pool:
-                    try:
-                        poster_id = await create_poster(
-                            pool,
-                            file_id=draft.get("photo_path") or draft["file_id"],  # Используем photo_path если есть
-                            caption=draft.get("caption") or "",
-                            ticket_url=draft.get("ticket_url")
-                        )
-                        logger.info("Poster saved to DB with ID: %s, photo_path: %s", poster_id, draft.get("photo_path"))
-                    except Exception as e:
-                        logger.error("Failed to save poster to DB: %s", e)
-                        await query.edit_message_text(f"❌ Ошибка сохранения в БД: {e}")
-                        return
+                if not pool:
+                    await query.edit_message_text("❌ База данных недоступна")
+                    return
+                try:
+                    poster_id = await create_poster(
+                        pool,
+                        file_id=draft["file_id"],
+                        caption=draft.get("caption") or "",
+                        ticket_url=draft.get("ticket_url"),
+                        photo_path=draft.get("photo_path"),
+                        photo_width=draft.get("photo_width"),
+                        photo_height=draft.get("photo_height"),
+                        photo_bytes=draft.get("photo_bytes"),
+                    )
+                    logger.info("Poster saved to DB with ID: %s, photo_path: %s", poster_id, draft.get("photo_path"))
+                except Exception as e:
+                    logger.error("Failed to save poster to DB: %s", e)
+                    await query.edit_message_text(f"❌ Ошибка сохранения в БД: {e}")
+                    return
                 
-                # Также сохраняем в bot_data для обратной совместимости
+                # Варианты фото для веб-приложения допишутся в афишу, когда будут готовы
+                if draft.get("photo_path"):
+                    context.application.create_task(attach_poster_images(context, poster_id, draft["photo_path"]))
+                
+                # Сразу добавляем в хранилище афиш; версию подтянет уведомление из БД
                 poster = {
                     "id": poster_id,
                     "file_id": draft["file_id"], 
@@ -1032,18 +1216,10 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     "caption": draft.get("caption") or "", 
                     "ticket_url": draft.get("ticket_url")
                 }
-                context.bot_data["poster"] = poster
-                
-                # Добавляем афишу в список всех афиш
-                all_posters = context.bot_data.get("all_posters", [])
-                all_posters.append(poster)
-                context.bot_data["all_posters"] = all_posters
-                
-                # Сбрасываем индекс для всех пользователей на последнюю афишу
-                # чтобы новая афиша показывалась сразу
-                for uid in context.application.user_data:
-                    user_data = context.application.user_data[uid]
-                    user_data["current_poster_index"] = len(all_posters) - 1
+                # Новая афиша повышает версию публикации: курсоры пользователей
+                # переключатся на неё при следующем открытии меню
+                store = get_poster_store(context)
+                store.upsert(poster)
                 
                 context.user_data.pop("poster_draft", None)
                 # Опубликовать в чат админу одним сообщением (фото+текст+кнопка)
@@ -1057,15 +1233,16 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     reply_markup=rm
                 )
                 
-                db_status = f"💾 ID в БД: {poster_id}" if poster_id else "⚠️ Не сохранено в БД"
                 await query.edit_message_text(
                     f"✅ Афиша сохранена и опубликована!\n\n"
-                    f"{db_status}\n"
-                    f"Всего афиш: {len(all_posters)}"
+                    f"💾 ID в БД: {poster_id}\n"
+                    f"Всего афиш: {len(store)}"
                 )
             
             elif sub == "cancel_poster":
-                context.user_data.pop("poster_draft", None)
+                draft = context.user_data.pop("poster_draft", None) or {}
+                if draft.get("photo_path"):
+                    context.application.create_task(discard_draft_photo(context, draft["photo_path"]))
                 await query.edit_message_text("Создание афиши отменено ❌")
             
             elif sub == "users_count":
@@ -1087,16 +1264,130 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 kb = [[InlineKeyboardButton("🔙 Назад в панель", callback_data="admin:refresh")]]
                 await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(kb), parse_mode="Markdown")
             
+            elif sub == "attendance":
+                # Сводка посещаемости по всем афишам (один кешированный запрос)
+                pool = get_db_pool(context)
+                back_kb = [[InlineKeyboardButton("🔙 Назад в панель", callback_data="admin:refresh")]]
+                if not pool:
+                    await query.edit_message_text("❌ База данных недоступна", reply_markup=InlineKeyboardMarkup(back_kb))
+                    return
+                try:
+                    rollup = await get_attendance_rollup(context).get(pool)
+                    captions = {p["id"]: p.get("caption") or "" for p in get_poster_store(context)}
+                    poster_ids = sorted(rollup, reverse=True)[:ATTENDANCE_SUMMARY_POSTERS]
+                    if not rollup:
+                        text = "📈 Посещений пока нет"
+                    else:
+                        text = "📈 *Посещаемость по афишам:*\n\n"
+                        for poster_id in poster_ids:
+                            counters = rollup[poster_id]
+                            title = (captions.get(poster_id) or f"Афиша #{poster_id}").split("\n", 1)[0][:40]
+                            text += (
+                                f"• {escape_markdown(title)}\n"
+                                f"   Всего: {counters['total_attendees']} "
+                                f"(👨 {counters['male_count']} / 👩 {counters['female_count']})\n"
+                                f"   До 18: {counters['age_under_18']}, 18–24: {counters['age_18_24']}, "
+                                f"25–34: {counters['age_25_34']}, 35+: {counters['age_35_plus']}\n\n"
+                            )
+                        if len(rollup) > len(poster_ids):
+                            text += f"…и ещё афиш: {len(rollup) - len(poster_ids)}"
+                    kb = [
+                        [InlineKeyboardButton(f"👥 Посетители #{poster_id}", callback_data=f"admin:attendees:{poster_id}")]
+                        for poster_id in poster_ids
+                    ]
+                    await query.edit_message_text(
+                        text, reply_markup=InlineKeyboardMarkup(kb + back_kb), parse_mode="Markdown"
+                    )
+                except Exception as e:
+                    logger.warning("Failed to show attendance summary: %s", e)
+                    await query.edit_message_text(
+                        f"❌ Ошибка получения посещаемости: {e}", reply_markup=InlineKeyboardMarkup(back_kb)
+                    )
+            
+            elif sub.startswith("attendees"):
+                # Список посетителей постранично: курсор храним в user_data (callback_data ограничен 64 байтами)
+                pool = get_db_pool(context)
+                if not pool:
+                    await query.edit_message_text("❌ База данных недоступна")
+                    return
+                
+                back_kb = [[InlineKeyboardButton("🔙 К посещаемости", callback_data="admin:attendance")]]
+                if sub == "attendees_next":
+                    poster_id, cursor = context.user_data.get("attendees_cursor", (None, None))
+                    if not poster_id:
+                        # query уже отвечен в handle_buttons, поэтому сообщаем через само сообщение
+                        await query.edit_message_text(
+                            "Список устарел, откройте его заново", reply_markup=InlineKeyboardMarkup(back_kb)
+                        )
+                        return
+                else:
+                    poster_id, cursor = int(sub.split(":", 1)[1]), None
+                
+                try:
+                    page = await get_poster_attendances_page(pool, poster_id, limit=ATTENDEES_PAGE_SIZE, cursor=cursor)
+                except Exception as e:
+                    # Ошибка БД или повреждённый курсор: начинать список придётся заново
+                    logger.error("Failed to load attendees of poster %s: %s", poster_id, e)
+                    context.user_data.pop("attendees_cursor", None)
+                    await query.edit_message_text(
+                        f"❌ Ошибка получения посетителей: {e}", reply_markup=InlineKeyboardMarkup(back_kb)
+                    )
+                    return
+                context.user_data["attendees_cursor"] = (poster_id, page["next_cursor"])
+                
+                lines = [f"👥 Посетители афиши #{poster_id}:\n"]
+                for att in page["items"]:
+                    gender = {"male": "👨", "female": "👩"}.get(att.get("gender"), "•")
+                    age = f", {att['age']}" if att.get("age") else ""
+                    lines.append(f"{gender} {att.get('name') or 'Без имени'}{age} — {att['attended_at'].strftime('%d.%m %H:%M')}")
+                if not page["items"]:
+                    lines.append("Никого нет")
+                
+                kb = []
+                if page["next_cursor"]:
+                    kb.append([InlineKeyboardButton("➡️ Далее", callback_data="admin:attendees_next")])
+                kb.extend(back_kb)
+                await query.edit_message_text("\n".join(lines), reply_markup=InlineKeyboardMarkup(kb))
+            
+            elif sub in ("export_xlsx", "export_csv"):
+                # Экспорт пользователей: читается курсором и пишется в отдельном потоке
+                pool = get_db_pool(context)
+                if not pool:
+                    await query.edit_message_text("❌ База данных недоступна")
+                    return
+                
+                await query.edit_message_text("⏳ Готовлю выгрузку пользователей...")
+                ext = "xlsx" if sub == "export_xlsx" else "csv"
+                export_path = DATA_DIR / f"users_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
+                try:
+                    if ext == "xlsx":
+                        await export_users_to_excel(pool, str(export_path))
+                    else:
+                        await export_users_to_csv(pool, str(export_path))
+                    with open(export_path, "rb") as export_file:
+                        await context.bot.send_document(
+                            chat_id=query.message.chat_id,
+                            document=export_file,
+                            filename=export_path.name,
+                            caption="📥 Выгрузка пользователей"
+                        )
+                    await query.edit_message_text("✅ Выгрузка готова")
+                except Exception as e:
+                    logger.error("Failed to export users: %s", e)
+                    await query.edit_message_text(f"❌ {e}")
+                finally:
+                    export_path.unlink(missing_ok=True)
+            
             elif sub == "list_posters":
                 # Показать список всех афиш
-                all_posters = context.bot_data.get("all_posters", [])
-                if not all_posters:
+                store = get_poster_store(context)
+                if not len(store):
                     text = "📋 Список афиш пуст"
                 else:
-                    text = f"📋 **Список всех афиш ({len(all_posters)}):**\n\n"
-                    current_poster = context.bot_data.get("poster")
+                    text = f"📋 **Список всех афиш ({len(store)}):**\n\n"
+                    current_poster = store.latest()
                     
-                    for i, poster in enumerate(all_posters):
+                    for i, poster in enumerate(store):
                         caption = poster.get("caption", "Без описания")
                         if len(caption) > 40:
                             caption = caption[:40] + "..."
@@ -1138,6 +1429,28 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 await asyncio.sleep(1)
                 await admin_panel(update, context)
             
+            elif sub == "checkin_mode":
+                # Режим проверки кодов на входе
+                context.user_data["awaiting_checkin"] = True
+                kb = [[InlineKeyboardButton("🔙 Завершить чек-ин", callback_data="admin:stop_checkin")]]
+                await query.edit_message_text(
+                    "🚪 **Режим чек-ина активирован**\n\n"
+                    "Отправляйте коды гостей по одному.\n"
+                    "Проверка выполняется без обращения к базе данных.",
+                    reply_markup=InlineKeyboardMarkup(kb),
+                    parse_mode="Markdown"
+                )
+            
+            elif sub == "stop_checkin":
+                context.user_data["awaiting_checkin"] = False
+                pool = get_db_pool(context)
+                if pool:
+                    try:
+                        await get_checkin_queue(context).flush(pool)
+                    except Exception as e:
+                        logger.warning("Failed to flush check-ins: %s", e)
+                await admin_panel(update, context)
+            
             elif sub == "refresh":
                 # Обновить админ-панель
                 await admin_panel(update, context)
@@ -1242,13 +1555,12 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 async def send_poster_to_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
-    all_posters = context.bot_data.get("all_posters", [])
-    if not all_posters:
+    # Берем последнюю (самую новую) афишу для рассылки
+    poster = get_poster_store(context).latest()
+    if not poster:
         await context.bot.send_message(chat_id, "Афиш пока нет ;(")
         return
-    
-    # Берем последнюю (самую новую) афишу для рассылки
-    poster = all_posters[-1]
+
     file_id = poster.get("file_id")
     caption = poster.get("caption", "")
     ticket_url = poster.get("ticket_url")
@@ -1273,49 +1585,6 @@ async def admin_only(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool
     return bool(user and (user.id in get_admins(context)))
 
 
-async def save_poster(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if not await admin_only(update, context):
-        return
-    msg = update.message
-    if not msg:
-        return
-    # If command is a reply to a photo, use that; otherwise, try this message
-    photo_msg = msg.reply_to_message if (msg.reply_to_message and msg.reply_to_message.photo) else msg
-    if not photo_msg.photo:
-        await msg.reply_text("Пожалуйста, ответь этой командой на сообщение с фото афиши и подписью.")
-        return
-    largest = photo_msg.photo[-1]
-    file_id = largest.file_id
-    caption = photo_msg.caption or ""
-    poster = context.bot_data.get("poster", {})
-    ticket_url = poster.get("ticket_url")
-    context.bot_data["poster"] = {"file_id": file_id, "caption": caption, "ticket_url": ticket_url}
-    await msg.reply_text("Афиша сохранена ✅ (фото и подпись). Для ссылки используйте /set_ticket <url>")
-
-
-async def set_ticket(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if not await admin_only(update, context):
-        return
-    msg = update.message
-    if not msg:
-        return
-    if not context.args:
-        await msg.reply_text("Укажи ссылку: /set_ticket https://...")
-        return
-    url = context.args[0].strip()
-    poster = context.bot_data.get("poster") or {}
-    poster["ticket_url"] = url
-    context.bot_data["poster"] = poster
-    await msg.reply_text("Ссылка на покупку билета сохранена ✅")
-
-
-async def delete_poster(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if not await admin_only(update, context):
-        return
-    context.bot_data.pop("poster", None)
-    await update.message.reply_text("Афиша удалена. Загрузите новую с /save_poster")
-
-
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Отобразить улучшенную админ-панель с inline кнопками."""
     user = update.effective_user
@@ -1336,14 +1605,14 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             logger.warning("Failed to get stats: %s", e)
     
     # Показать информацию об афишах и пользователях
-    all_posters = context.bot_data.get("all_posters", [])
-    current_poster = context.bot_data.get("poster")
+    store = get_poster_store(context)
+    current_poster = store.latest()
     
     status_text = "🛠 **Админ-панель TusaBot**\n\n"
     
     # Статистика афиш
     status_text += "📊 **Афиши:**\n"
-    status_text += f"• Всего афиш: {len(all_posters)}\n"
+    status_text += f"• Всего афиш: {len(store)}\n"
     if current_poster:
         status_text += "• Текущая афиша: ✅ есть\n"
         if current_poster.get("ticket_url"):
@@ -1385,7 +1654,15 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             InlineKeyboardButton("🔄 Обновить", callback_data="admin:refresh")
         ],
         [
-            InlineKeyboardButton("👥 Пользователи", callback_data="admin:users_count")
+            InlineKeyboardButton("👥 Пользователи", callback_data="admin:users_count"),
+            InlineKeyboardButton("🚪 Чек-ин на входе", callback_data="admin:checkin_mode")
+        ],
+        [
+            InlineKeyboardButton("📈 Посещаемость", callback_data="admin:attendance")
+        ],
+        [
+            InlineKeyboardButton("📥 Экспорт Excel", callback_data="admin:export_xlsx"),
+            InlineKeyboardButton("📥 Экспорт CSV", callback_data="admin:export_csv")
         ],
         # Выход
         [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
@@ -1529,13 +1806,11 @@ async def do_weekly_broadcast(context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     
     # Получаем последнюю афишу для рассылки
-    all_posters = context.bot_data.get("all_posters", [])
-    if not all_posters:
+    latest_poster = get_poster_store(context).latest()
+    if not latest_poster:
         logger.info("No posters to broadcast")
         return
     
-    latest_poster = all_posters[-1]
-    
     # Рассылка в Telegram (только в личные сообщения пользователям)
     success_count = 0
     for user_id in known_users:
@@ -1563,6 +1838,48 @@ async def weekly_job(context: CallbackContext) -> None:
     await do_weekly_broadcast(context)
 
 
+async def flush_checkins_job(context: CallbackContext) -> None:
+    """Записать накопленные чек-ины в БД пачкой"""
+    pool = get_db_pool(context)
+    queue = get_checkin_queue(context)
+    if not pool or not len(queue):
+        return
+    try:
+        if await queue.flush(pool):
+            # Дочитываем в сводку только что записанные посещения
+            await get_attendance_rollup(context).refresh(pool)
+    except Exception as e:
+        logger.warning("Failed to flush check-ins: %s", e)
+
+
+def get_health_prober(context: CallbackContext) -> HealthProber:
+    prober = context.bot_data.get("health_prober")
+    if prober is None:
+        async def check_database() -> None:
+            pool = get_db_pool(context)
+            if not pool:
+                raise RuntimeError("DB pool not initialized")
+            async with pool.acquire() as conn:
+                await conn.fetchval("SELECT 1")
+
+        async def check_telegram() -> None:
+            await context.bot.get_me()
+
+        prober = HealthProber({"database": check_database, "telegram": check_telegram})
+        context.bot_data["health_prober"] = prober
+    return prober
+
+
+async def heartbeat_job(context: CallbackContext) -> None:
+    """Проверить БД и Telegram и записать heartbeat бота (его читает /health/ready в API)"""
+    prober = get_health_prober(context)
+    await prober.probe()
+    try:
+        write_heartbeat(prober.results())
+    except Exception as e:
+        logger.warning("Failed to write bot heartbeat: %s", e)
+
+
 def schedule_weekly(app: Application) -> None:
     job_queue = app.job_queue
     send_time_utc = time(hour=WEEKLY_HOUR_UTC, minute=WEEKLY_MINUTE, tzinfo=pytz.utc)
@@ -1706,7 +2023,23 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             await handle_registration_step(update, context, text, user, user_data, reg_step)
             return
         
-        # ПРИОРИТЕТ 2: Проверка подписки по username/ID (для админов)
+        # ПРИОРИТЕТ 2: Проверка кодов гостей на входе (для админов)
+        if user_data.get("awaiting_checkin") and user.id in get_admins(context):
+            kb = [[InlineKeyboardButton("🔙 Завершить чек-ин", callback_data="admin:stop_checkin")]]
+            try:
+                claims = verify_checkin_token(text)
+            except InvalidCheckinToken as e:
+                await update.message.reply_text(f"❌ {e}", reply_markup=InlineKeyboardMarkup(kb))
+                return
+            
+            if get_checkin_queue(context).add(claims.tg_id, claims.poster_id):
+                reply = f"✅ Гость `{claims.tg_id}` допущен (афиша #{claims.poster_id})"
+            else:
+                reply = f"⚠️ Гость `{claims.tg_id}` уже прошёл по этому коду"
+            await update.message.reply_text(reply, reply_markup=InlineKeyboardMarkup(kb), parse_mode="Markdown")
+            return
+        
+        # ПРИОРИТЕТ 3: Проверка подписки по username/ID (для админов)
         if user_data.get("awaiting_username_check"):
             # НЕ сбрасываем флаг здесь! Он будет сброшен после обработки, если НЕ в режиме continuous
             
@@ -1849,9 +2182,17 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         if context.user_data.get("awaiting_ticket"):
             context.user_data["awaiting_ticket"] = False
             url = update.message.text.strip()
-            poster = context.bot_data.get("poster") or {}
+            poster = get_poster_store(context).latest()
+            if not poster:
+                await update.message.reply_text("❌ Нет активной афиши")
+                return
             poster["ticket_url"] = url
-            context.bot_data["poster"] = poster
+            pool = get_db_pool(context)
+            if pool:
+                try:
+                    await update_poster_ticket_url(pool, poster["id"], url)
+                except Exception as e:
+                    logger.warning("Failed to save ticket url to DB: %s", e)
             await update.message.reply_text("Ссылка сохранена ✅")
             return
             
@@ -2072,29 +2413,27 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             # Получаем файл из Telegram
             file = await context.bot.get_file(file_id)
             
-            # Создаем папку для афиш если её нет
-            posters_dir = Path(__file__).parent / "project" / "public" / "posters"
-            posters_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Генерируем уникальное имя файла
-            import time
-            timestamp = int(time.time())
+            # Скачиваем файл и сохраняем под именем из хеша содержимого
             file_ext = file.file_path.split('.')[-1] if '.' in file.file_path else 'jpg'
-            filename = f"poster_{timestamp}.{file_ext}"
-            local_path = posters_dir / filename
+            data = bytes(await file.download_as_bytearray())
+            web_path = await asyncio.to_thread(save_poster_bytes, data, file_ext)
             
-            # Скачиваем файл
-            await file.download_to_drive(local_path)
-            
-            # Сохраняем путь для веб-приложения (относительный путь)
-            web_path = f"/posters/{filename}"
+            # Нарезаем уменьшенные копии в фоне, пока админ заполняет черновик
+            get_image_pipeline(context).start(web_path)
             
+            previous_path = draft.get("photo_path")
             draft["file_id"] = file_id  # Оставляем для бота
             draft["photo_path"] = web_path  # Для веб-приложения
+            draft["photo_width"] = largest.width
+            draft["photo_height"] = largest.height
+            draft["photo_bytes"] = len(data)
             draft["step"] = "caption"
             context.user_data["poster_draft"] = draft
+            if previous_path and previous_path != web_path:
+                # Фото черновика заменено: забираем задачу нарезки старого и удаляем его файлы
+                context.application.create_task(discard_draft_photo(context, previous_path))
             
-            logger.info(f"Photo saved to {local_path}, web path: {web_path}")
+            logger.info(f"Photo saved, web path: {web_path}")
             
             await update.message.reply_text(
                 "✅ Фото сохранено!\n\nШаг 2/4: пришлите текст (подпись) для афиши",
@@ -2143,30 +2482,20 @@ def build_app() -> Application:
             user_ids = await get_all_user_ids(pool)
             app.bot_data["known_users"] = set(user_ids)
             
-            # Загружаем активные афиши из БД
-            try:
-                posters_from_db = await get_active_posters(pool)
-                if posters_from_db:
-                    # Конвертируем в формат bot_data
-                    all_posters = []
-                    for p in posters_from_db:
-                        all_posters.append({
-                            "id": p["id"],
-                            "file_id": p["file_id"],
-                            "caption": p["caption"],
-                            "ticket_url": p["ticket_url"]
-                        })
-                    app.bot_data["all_posters"] = all_posters
-                    # Последняя афиша становится текущей
-                    if all_posters:
-                        app.bot_data["poster"] = all_posters[-1]
-                    logger.info("Loaded %d active posters from DB", len(all_posters))
-                else:
-                    app.bot_data["all_posters"] = []
-                    logger.info("No active posters in DB")
-            except Exception as e:
-                logger.warning("Failed to load posters from DB: %s", e)
-                app.bot_data["all_posters"] = []
+            # Загружаем активные афиши из БД и подписываемся на их изменения
+            listener = PosterChangeListener(
+                lambda event: apply_poster_change(app, event),
+                on_reconnect=lambda: reload_posters(app),
+            )
+            listener.start()
+            app.bot_data["poster_listener"] = listener
+            # Афиши загружает сам слушатель после LISTEN; без него читаем их напрямую
+            if not await listener.wait_ready():
+                try:
+                    await reload_posters(app)
+                except Exception as e:
+                    logger.warning("Failed to load posters from DB: %s", e)
+                    app.bot_data["posters"] = PosterStore()
             
             # Настраиваем команды бота (только для обычных пользователей)
             commands = [
@@ -2180,7 +2509,19 @@ def build_app() -> Application:
             logger.error("Failed to init DB: %s", e)
 
     async def _on_shutdown(app: Application):
+        listener = app.bot_data.get("poster_listener")
+        if listener:
+            await listener.stop()
+        pipeline = app.bot_data.get("image_pipeline")
+        if pipeline:
+            pipeline.shutdown()
         pool = app.bot_data.get("db_pool")
+        queue = app.bot_data.get("checkin_queue")
+        if pool and queue:
+            try:
+                await queue.flush(pool)
+            except Exception as e:
+                logger.warning("Failed to flush check-ins on shutdown: %s", e)
         if pool:
             try:
                 await pool.close()
@@ -2235,6 +2576,11 @@ def build_app() -> Application:
     # schedule_weekly(app)
     # ==================================
     
+    # Пакетная запись чек-инов с входа
+    app.job_queue.run_repeating(flush_checkins_job, interval=CHECKIN_FLUSH_SECONDS, first=CHECKIN_FLUSH_SECONDS)
+    # Heartbeat бота для проверок готовности
+    app.job_queue.run_repeating(heartbeat_job, interval=HEALTH_PROBE_SECONDS, first=1)
+
     # Notify admin shortly after start
     app.job_queue.run_once(_notify_admin_start, when=1)
     return app
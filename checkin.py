@@ -0,0 +1,137 @@
+"""
+Подписанные токены для чек-ина гостей на входе.
+
+Токен содержит tg_id, poster_id и срок действия и подписан HMAC-SHA256,
+поэтому проверка на входе не требует обращения к базе данных.
+Подтверждённые посещения копятся в очереди и записываются в БД пачкой.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import struct
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+import asyncpg
+
+from db import mark_attendances_batch
+
+logger = logging.getLogger("TusaBot")
+
+# Версия формата токена, tg_id, poster_id, срок действия (unix time)
+_PAYLOAD = struct.Struct(">BqIQ")
+_TOKEN_VERSION = 1
+_SIGNATURE_BYTES = 16
+
+# Сколько последних чек-инов помнить для ответа «уже прошёл»; дубли сверх
+# этого отсекает ON CONFLICT DO NOTHING в БД
+CHECKIN_SEEN_MAX = int(os.getenv("CHECKIN_SEEN_MAX", "10000"))
+
+
+class CheckinClaims(NamedTuple):
+    tg_id: int
+    poster_id: int
+    expires_at: int
+
+
+class InvalidCheckinToken(ValueError):
+    """Токен повреждён, подделан или просрочен"""
+
+
+def _secret() -> bytes:
+    # Читаем окружение при вызове: bot.py загружает .env уже после импорта модулей
+    secret = os.getenv("CHECKIN_SECRET", "")
+    if secret:
+        return secret.encode()
+    # Если отдельный секрет не задан, выводим его из токена бота
+    bot_token = os.getenv("BOT_TOKEN", "")
+    if not bot_token:
+        raise RuntimeError("CHECKIN_SECRET or BOT_TOKEN must be set")
+    return hmac.new(bot_token.encode(), b"tusabot-checkin", hashlib.sha256).digest()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(_secret(), payload, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+
+
+def issue_checkin_token(tg_id: int, poster_id: int, ttl_hours: Optional[int] = None) -> str:
+    """Выпустить токен чек-ина для пользователя на конкретную афишу"""
+    ttl = int(os.getenv("CHECKIN_TTL_HOURS", "72")) if ttl_hours is None else ttl_hours
+    expires_at = int(time.time()) + ttl * 3600
+    payload = _PAYLOAD.pack(_TOKEN_VERSION, tg_id, poster_id, expires_at)
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+
+def verify_checkin_token(token: str, now: Optional[float] = None) -> CheckinClaims:
+    """Проверить токен без обращения к БД. Бросает InvalidCheckinToken"""
+    try:
+        payload_part, signature_part = token.strip().split(".", 1)
+        payload = _b64decode(payload_part)
+        signature = _b64decode(signature_part)
+    except (ValueError, AttributeError):
+        raise InvalidCheckinToken("Неверный формат токена")
+
+    if len(payload) != _PAYLOAD.size:
+        raise InvalidCheckinToken("Неверный формат токена")
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidCheckinToken("Подпись токена недействительна")
+
+    version, tg_id, poster_id, expires_at = _PAYLOAD.unpack(payload)
+    if version != _TOKEN_VERSION:
+        raise InvalidCheckinToken("Неподдерживаемая версия токена")
+    if expires_at < (time.time() if now is None else now):
+        raise InvalidCheckinToken("Срок действия токена истёк")
+    return CheckinClaims(tg_id, poster_id, expires_at)
+
+
+class AttendanceQueue:
+    """Очередь подтверждённых посещений для пакетной записи в БД"""
+
+    def __init__(self, seen_max: int = CHECKIN_SEEN_MAX) -> None:
+        self._pending: dict[tuple[int, int], datetime] = {}
+        # Недавние чек-ины, от старых к новым; размер ограничен seen_max
+        self._seen: OrderedDict[tuple[int, int], None] = OrderedDict()
+        self._seen_max = seen_max
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, tg_id: int, poster_id: int) -> bool:
+        """Поставить посещение в очередь. False если гость уже прошёл"""
+        key = (tg_id, poster_id)
+        if key in self._seen or key in self._pending:
+            return False
+        self._seen[key] = None
+        if len(self._seen) > self._seen_max:
+            self._seen.popitem(last=False)
+        self._pending[key] = datetime.now(timezone.utc)
+        return True
+
+    async def flush(self, pool: asyncpg.Pool) -> int:
+        """Записать накопленные посещения в БД одним запросом"""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        rows = [(tg_id, poster_id, attended_at) for (tg_id, poster_id), attended_at in batch.items()]
+        try:
+            inserted = await mark_attendances_batch(pool, rows)
+        except Exception:
+            # Возвращаем записи в очередь, чтобы не потерять их до следующей попытки
+            for key, attended_at in batch.items():
+                self._pending.setdefault(key, attended_at)
+            raise
+        logger.info("Flushed %d check-ins (%d new attendances)", len(rows), inserted)
+        return inserted
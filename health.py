@@ -0,0 +1,140 @@
+"""
+Фоновые проверки здоровья для API и бота.
+
+HealthProber раз в HEALTH_PROBE_SECONDS выполняет проверки (SELECT 1 в
+БД, getMe в Telegram и т.п.) и запоминает результат с временем проверки.
+Эндпоинты /health/ready и /health отвечают из этого состояния и сами
+никуда не ходят, поэтому частые пробы не занимают соединения пула и не
+встают в очередь за настоящими запросами.
+
+Бот пишет такое же состояние в файл-heartbeat (BOT_HEARTBEAT_PATH), API
+читает его как ещё одну проверку: по возрасту файла видно, что бот жив.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger("TusaBot")
+
+HEALTH_PROBE_SECONDS = float(os.getenv("HEALTH_PROBE_SECONDS", "10"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))
+BOT_HEARTBEAT_PATH = Path(os.getenv("BOT_HEARTBEAT_PATH") or Path(__file__).parent / "data" / "bot_heartbeat.json")
+# Heartbeat бота старше этого считается пропущенным
+BOT_HEARTBEAT_MAX_AGE = float(os.getenv("BOT_HEARTBEAT_MAX_AGE", "90"))
+
+
+class HealthProber:
+    """Периодически выполняет проверки и хранит их последний результат"""
+
+    def __init__(
+        self,
+        checks: Dict[str, Callable[[], Awaitable[None]]],
+        required: Iterable[str] = (),
+        interval: float = HEALTH_PROBE_SECONDS,
+        timeout: float = HEALTH_PROBE_TIMEOUT,
+    ) -> None:
+        self._checks = checks
+        self.required = frozenset(required)
+        self._interval = interval
+        self._timeout = timeout
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._probe_forever())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def probe(self) -> None:
+        """Выполнить все проверки параллельно"""
+        await asyncio.gather(*(self._run(name, check) for name, check in self._checks.items()))
+
+    async def _run(self, name: str, check: Callable[[], Awaitable[None]]) -> None:
+        started = time.monotonic()
+        error = None
+        try:
+            await asyncio.wait_for(check(), timeout=self._timeout)
+        except asyncio.TimeoutError:
+            error = f"timeout after {self._timeout:g}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        previous = self._results.get(name)
+        if error and (previous is None or previous["ok"] or previous["error"] != error):
+            logger.warning("Health check %s failed: %s", name, error)
+        self._results[name] = {
+            "ok": error is None,
+            "error": error,
+            "latency_ms": round((time.monotonic() - started) * 1000, 1),
+            "checked_at": time.time(),
+        }
+
+    async def _probe_forever(self) -> None:
+        while True:
+            await self.probe()
+            await asyncio.sleep(self._interval)
+
+    def results(self) -> Dict[str, Dict[str, Any]]:
+        """Последние результаты проверок с их возрастом"""
+        now = time.time()
+        return {
+            name: {**result, "age_seconds": round(now - result["checked_at"], 1)}
+            for name, result in self._results.items()
+        }
+
+    def public_results(self) -> Dict[str, Dict[str, Any]]:
+        """Результаты без текста ошибок — для публичного /health/ready.
+
+        Текст исключения (адрес БД, ошибка авторизации) остаётся в логе.
+        """
+        return {
+            name: {key: value for key, value in result.items() if key != "error"}
+            for name, result in self.results().items()
+        }
+
+    def failing(self) -> list[str]:
+        """Обязательные проверки, которые не выполнены, не прошли или устарели"""
+        now = time.time()
+        # Пропущенные два цикла подряд значат, что сам пробер завис
+        max_age = self._interval * 2 + self._timeout
+        failing = []
+        for name in sorted(self.required):
+            result = self._results.get(name)
+            if result is None or not result["ok"] or now - result["checked_at"] > max_age:
+                failing.append(name)
+        return failing
+
+    def is_ready(self) -> bool:
+        """Все обязательные проверки выполнены, прошли и не устарели"""
+        return not self.failing()
+
+
+def write_heartbeat(results: Dict[str, Dict[str, Any]], path: Path = BOT_HEARTBEAT_PATH) -> None:
+    """Записать heartbeat атомарно: читатель не увидит половину файла"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps({"pid": os.getpid(), "written_at": time.time(), "checks": results}))
+    os.replace(tmp_path, path)
+
+
+def read_heartbeat(path: Path = BOT_HEARTBEAT_PATH) -> Dict[str, Any]:
+    """Прочитать heartbeat бота. ValueError, если его нет или он устарел"""
+    try:
+        heartbeat = json.loads(path.read_text())
+    except FileNotFoundError:
+        raise ValueError("no heartbeat")
+    age = time.time() - heartbeat["written_at"]
+    if age > BOT_HEARTBEAT_MAX_AGE:
+        raise ValueError(f"heartbeat is {age:.0f}s old")
+    failed = [name for name, result in heartbeat["checks"].items() if not result["ok"]]
+    if failed:
+        raise ValueError(f"bot checks failing: {', '.join(failed)}")
+    return heartbeat
@@ -0,0 +1,117 @@
+"""
+Статический манифест афиш для раздачи через nginx.
+
+После каждого изменения афиш API записывает тот же JSON, что отдаёт
+/posters, в project/public/posters.json, рядом — сжатые posters.json.gz и
+(если установлен пакет brotli) posters.json.br. Файлы заменяются атомарно
+через os.replace, поэтому nginx никогда не отдаст недописанный файл.
+Эндпоинт /posters остаётся запасным вариантом.
+
+Если воркеров uvicorn несколько, манифест публикует каждый из них; запись
+идёт под flock и пропускается, когда на диске уже лежит тот же JSON, так
+что сжатие выполняет один воркер. Рядом с манифестом хранится версия
+изменений афиш (posters_version_seq), по которой он построен: воркер, ещё
+не получивший последнее изменение, не перезапишет более новый манифест.
+"""
+
+import asyncio
+import fcntl
+import gzip
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него пишется только .gz
+    brotli = None
+
+logger = logging.getLogger("TusaBotAPI")
+
+POSTERS_MANIFEST_PATH = Path(
+    os.getenv("POSTERS_MANIFEST_PATH") or Path(__file__).parent / "project" / "public" / "posters.json"
+)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _read_version(path: Path) -> int:
+    try:
+        return int(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return -1
+
+
+def write_manifest(body: bytes, path: Path = POSTERS_MANIFEST_PATH, version: int = 0) -> bool:
+    """Записать манифест и его сжатые варианты.
+
+    False, если такой манифест уже записан или на диске манифест более новой версии.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    version_path = path.with_name(f".{path.name}.version")
+    fd = os.open(path.with_name(f".{path.name}.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if _read_version(version_path) > version:
+            return False
+        try:
+            if path.read_bytes() == body:
+                _write_atomic(version_path, str(version).encode())
+                return False
+        except FileNotFoundError:
+            pass
+        # mtime=0: одинаковый JSON всегда даёт одинаковый .gz
+        _write_atomic(path.with_name(path.name + ".gz"), gzip.compress(body, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write_atomic(path.with_name(path.name + ".br"), brotli.compress(body, quality=11))
+        _write_atomic(path, body)
+        _write_atomic(version_path, str(version).encode())
+        return True
+    finally:
+        os.close(fd)
+
+
+class ManifestPublisher:
+    """Перезаписывает манифест после изменений; частые изменения схлопываются в одну запись"""
+
+    def __init__(self, render: Callable[[], Tuple[int, bytes]], path: Path = POSTERS_MANIFEST_PATH) -> None:
+        """render() возвращает (версию изменений афиш, JSON манифеста)"""
+        self._render = render
+        self._path = path
+        self._dirty = asyncio.Event()
+        self._last_body: Optional[bytes] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._publish_forever())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def request(self) -> None:
+        """Отметить, что афиши изменились и манифест нужно переписать"""
+        self._dirty.set()
+
+    async def _publish_forever(self) -> None:
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            try:
+                version, body = self._render()
+                if body == self._last_body:
+                    continue
+                # Сжатие brotli на максимальном уровне заметно по времени, уносим его из event loop
+                written = await asyncio.to_thread(write_manifest, body, self._path, version)
+                self._last_body = body
+                if written:
+                    logger.info("Published posters manifest to %s (%d bytes)", self._path, len(body))
+            except Exception as e:
+                logger.warning("Failed to publish posters manifest: %s", e)
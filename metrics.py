@@ -0,0 +1,190 @@
+"""
+Метрики API в текстовом формате Prometheus (/metrics).
+
+Счётчики и гистограммы — обычные словари в памяти процесса: на запрос
+приходится одно сложение и bisect, без логирования и без внешних
+зависимостей. Значения, которые и так лежат в объектах (размер пула,
+попадания кеша фото), не дублируются, а читаются колбэками в момент
+сбора метрик.
+
+Наружу через nginx /metrics не проксируется: Prometheus забирает его
+напрямую с localhost:8000.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[str, ...]
+
+_registry: list = []
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    def __init__(self, name: str, help: str, labelnames: Labels = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[Labels, float] = {}
+        _registry.append(self)
+
+    def inc(self, labels: Labels = (), amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками"""
+
+    def __init__(self, name: str, help: str, labelnames: Labels = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Метки -> [счётчики по корзинам (последняя — +Inf), сумма]
+        self._values: dict[Labels, list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def time(self, labels: Labels = ()) -> "_Timer":
+        return _Timer(self, labels)
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Labels) -> None:
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self) -> None:
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self._histogram.observe(time.perf_counter() - self._started, self._labels)
+
+
+class CallbackMetric:
+    """Метрика, значения которой читаются колбэком при сборе"""
+
+    def __init__(self, name: str, help: str, type: str, labelnames: Labels,
+                 read: Callable[[], Iterable[tuple[Labels, float]]]) -> None:
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = labelnames
+        self._read = read
+        _registry.append(self)
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        for labels, value in self._read():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+def render() -> bytes:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return ("\n".join(lines) + "\n").encode()
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "tusabot_http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route"),
+)
+HTTP_RESPONSES = Counter(
+    "tusabot_http_responses_total", "Ответы HTTP по маршруту и статусу", ("method", "route", "status"),
+)
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    "tusabot_db_pool_acquire_seconds", "Ожидание свободного соединения в пуле asyncpg", ("pool",),
+)
+TELEGRAM_REQUEST_SECONDS = Histogram(
+    "tusabot_telegram_request_duration_seconds", "Запросы к Telegram Bot API из /photo", ("method",),
+)
+
+
+class MetricsMiddleware:
+    """Замеряет время и статус ответа для каждого маршрута.
+
+    Метка route — шаблон пути (/posters/{poster_id}), а не сам путь, чтобы
+    число рядов не росло с числом афиш. Время считается до конца отправки
+    тела: для SSE это длительность подписки.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status: Optional[int] = None
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            # FastAPI кладёт найденный маршрут в scope при роутинге
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, (method, route_label))
+            HTTP_RESPONSES.inc((method, route_label, str(status or 0)))
@@ -0,0 +1,7 @@
+-- Миграция 002: Индексы для keyset-пагинации истории посещений
+
+CREATE INDEX IF NOT EXISTS idx_attendances_user_keyset
+    ON attendances(user_id, attended_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_attendances_poster_keyset
+    ON attendances(poster_id, attended_at DESC, id DESC);
@@ -0,0 +1,9 @@
+-- Миграция 003: Версии афиш для синхронизации кешей через LISTEN/NOTIFY
+
+CREATE SEQUENCE IF NOT EXISTS posters_version_seq;
+
+ALTER TABLE posters
+    ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('posters_version_seq'),
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now();
+
+GRANT ALL PRIVILEGES ON SEQUENCE posters_version_seq TO tusabot;
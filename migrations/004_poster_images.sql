@@ -0,0 +1,6 @@
+-- Миграция 004: Размеры фото афиши и уменьшенные копии (JPEG/WebP) для веб-приложения
+
+ALTER TABLE posters
+    ADD COLUMN IF NOT EXISTS photo_width INTEGER,
+    ADD COLUMN IF NOT EXISTS photo_height INTEGER,
+    ADD COLUMN IF NOT EXISTS photo_variants JSONB;
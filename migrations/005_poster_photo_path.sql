@@ -0,0 +1,11 @@
+-- Миграция 005: Локальная копия фото афиши рядом с Telegram file_id
+
+ALTER TABLE posters
+    ADD COLUMN IF NOT EXISTS photo_path TEXT,
+    ADD COLUMN IF NOT EXISTS photo_bytes INTEGER;
+
+-- Старые афиши хранили путь к файлу в file_id
+UPDATE posters
+SET photo_path = file_id
+WHERE photo_path IS NULL
+  AND (file_id LIKE '/posters/%' OR file_id LIKE 'posters/%');
@@ -0,0 +1,4 @@
+-- Миграция 006: Частичный индекс для постраничного списка активных афиш
+
+CREATE INDEX IF NOT EXISTS idx_posters_active_keyset
+    ON posters(created_at DESC, id DESC) WHERE is_active;
@@ -0,0 +1,233 @@
+"""
+Дисковый кеш фото из Telegram для прокси /photo/{file_id}.
+
+Один httpx-клиент на процесс держит соединения с api.telegram.org.
+file_id -> file_path из getFile кешируется на TELEGRAM_FILE_PATH_TTL секунд
+(Telegram гарантирует ссылку минимум на час). Скачанные фото лежат на диске
+и вытесняются по LRU (время последнего обращения = mtime файла), когда
+суммарный размер превышает PHOTO_CACHE_MAX_MB.
+
+Кеш общий для всех воркеров uvicorn: состояние — сами файлы в
+PHOTO_CACHE_DIR, а не словари в памяти. Загрузка одного фото идёт под
+flock, поэтому одновременные промахи в разных воркерах скачивают его один
+раз; внутри процесса они ждут одну общую загрузку. Файлы, к которым
+обращались последние EVICT_GRACE_SECONDS, не вытесняются: путь, только что
+отданный из get(), успеет открыть FileResponse или nginx. Байты фото в память
+воркеров не читаются: горячие файлы лежат в page cache ОС в одном
+экземпляре, а при PHOTO_CACHE_ACCEL_PREFIX их отдаёт сам nginx.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+from metrics import TELEGRAM_REQUEST_SECONDS
+
+logger = logging.getLogger("TusaBotAPI")
+
+PHOTO_CACHE_DIR = Path(os.getenv("PHOTO_CACHE_DIR") or Path(__file__).parent / "data" / "photo_cache")
+PHOTO_CACHE_MAX_MB = int(os.getenv("PHOTO_CACHE_MAX_MB", "512"))
+TELEGRAM_FILE_PATH_TTL = float(os.getenv("TELEGRAM_FILE_PATH_TTL", "3000"))
+# Внутренний location nginx, из которого отдаются файлы кеша (X-Accel-Redirect); пусто — отдаёт API
+PHOTO_CACHE_ACCEL_PREFIX = os.getenv("PHOTO_CACHE_ACCEL_PREFIX", "")
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+# Временные файлы старше этого возраста остались от упавших загрузок
+STALE_TMP_SECONDS = 600
+# Недавно использованные файлы не вытесняются, даже если кеш переполнен
+EVICT_GRACE_SECONDS = 60
+# Пауза между попытками взять замок загрузки, занятый другим воркером
+LOCK_RETRY_SECONDS = 0.05
+
+
+class PhotoNotFound(LookupError):
+    """Telegram не знает такой file_id"""
+
+
+class TelegramPhotoCache:
+    """Кеш фото Telegram на диске, общий для процессов, с LRU-вытеснением"""
+
+    def __init__(
+        self,
+        bot_token: str,
+        cache_dir: Path = PHOTO_CACHE_DIR,
+        max_bytes: int = PHOTO_CACHE_MAX_MB * 1024 * 1024,
+    ) -> None:
+        self._bot_token = bot_token
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._client: Optional[httpx.AsyncClient] = None
+        self._file_paths: dict[str, tuple[str, float]] = {}
+        self._downloads: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        # Свежие .tmp могут принадлежать загрузкам соседних воркеров — их не трогаем
+        now = time.time()
+        for path in self._cache_dir.glob(".*.tmp"):
+            try:
+                if now - path.stat().st_mtime > STALE_TMP_SECONDS:
+                    path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+        files, total_bytes = await asyncio.to_thread(self._evict)
+        logger.info("Photo cache: %d files, %.1f MB", files, total_bytes / 1024 / 1024)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def ping(self) -> None:
+        """Проверить доступность Bot API (getMe) через то же соединение"""
+        with TELEGRAM_REQUEST_SECONDS.time(("getMe",)):
+            response = await self._client.get(f"https://api.telegram.org/bot{self._bot_token}/getMe")
+        if not response.json().get("ok"):
+            raise RuntimeError(f"getMe failed with HTTP {response.status_code}")
+
+    def _name(self, file_id: str) -> str:
+        return hashlib.sha256(file_id.encode()).hexdigest()[:32] + ".jpg"
+
+    async def get(self, file_id: str) -> Path:
+        """Путь к фото на диске; при промахе скачивает его из Telegram"""
+        name = self._name(file_id)
+        path = self._cache_dir / name
+        try:
+            # Обновляем mtime: по нему считается LRU во всех воркерах
+            os.utime(path)
+            self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+
+        self.misses += 1
+        download = self._downloads.get(file_id)
+        if download is None:
+            download = asyncio.ensure_future(self._download(file_id, name))
+            self._downloads[file_id] = download
+            download.add_done_callback(lambda _: self._downloads.pop(file_id, None))
+        # shield: отмена одного запроса не должна обрывать загрузку для остальных
+        return await asyncio.shield(download)
+
+    async def _resolve_file_path(self, file_id: str) -> str:
+        cached = self._file_paths.get(file_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        with TELEGRAM_REQUEST_SECONDS.time(("getFile",)):
+            response = await self._client.get(
+                f"https://api.telegram.org/bot{self._bot_token}/getFile",
+                params={"file_id": file_id},
+            )
+        data = response.json()
+        if not data.get("ok"):
+            raise PhotoNotFound(file_id)
+        file_path = data["result"]["file_path"]
+        self._file_paths[file_id] = (file_path, time.monotonic() + TELEGRAM_FILE_PATH_TTL)
+        return file_path
+
+    def _lock(self, lock_name: str, blocking: bool = True) -> Optional[int]:
+        """Взять межпроцессный flock. С blocking=False вернёт None, если замок занят"""
+        fd = os.open(self._cache_dir / f".{lock_name}.lock", os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    async def _lock_download(self, path: Path) -> Optional[int]:
+        """Замок загрузки файла; None, если пока ждали, файл скачал другой воркер.
+
+        Ждём в event loop неблокирующими попытками, а не в потоке: пока
+        другой воркер качает фото, поток из пула по умолчанию не занят.
+        """
+        # Замки по первым двум символам хеша: не больше 256 файлов-замков
+        lock_name = path.name[:2]
+        while True:
+            fd = self._lock(lock_name, blocking=False)
+            if fd is not None:
+                return fd
+            if path.exists():
+                return None
+            await asyncio.sleep(LOCK_RETRY_SECONDS)
+
+    @staticmethod
+    def _unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    async def _download(self, file_id: str, name: str) -> Path:
+        path = self._cache_dir / name
+        fd = await self._lock_download(path)
+        if fd is None:
+            return path
+        try:
+            if path.exists():
+                # Пока ждали замок, фото скачал другой воркер
+                return path
+            file_path = await self._resolve_file_path(file_id)
+            tmp_path = path.with_name(f".{name}.{os.getpid()}.tmp")
+            try:
+                url = f"https://api.telegram.org/file/bot{self._bot_token}/{file_path}"
+                with TELEGRAM_REQUEST_SECONDS.time(("download",)):
+                    async with self._client.stream("GET", url) as response:
+                        if response.status_code == 404:
+                            # Ссылка могла протухнуть раньше TTL: в следующий раз спросим getFile заново
+                            self._file_paths.pop(file_id, None)
+                            raise PhotoNotFound(file_id)
+                        response.raise_for_status()
+                        with open(tmp_path, "wb") as f:
+                            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                                f.write(chunk)
+                os.replace(tmp_path, path)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+        finally:
+            self._unlock(fd)
+
+        await asyncio.to_thread(self._evict)
+        return path
+
+    def _evict(self) -> tuple[int, int]:
+        """Удалить давно не использованные файлы сверх лимита. Возвращает (файлов, байт) после"""
+        fd = self._lock("evict")
+        try:
+            entries = []
+            for entry in os.scandir(self._cache_dir):
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+            entries.sort()
+            total_bytes = sum(size for _, _, size in entries)
+            files = len(entries)
+            evict_before = time.time() - EVICT_GRACE_SECONDS
+            # Самый свежий файл не вытесняем, даже если он один больше лимита
+            for mtime, name, size in entries[:-1]:
+                if total_bytes <= self._max_bytes or mtime > evict_before:
+                    break
+                (self._cache_dir / name).unlink(missing_ok=True)
+                total_bytes -= size
+                files -= 1
+            return files, total_bytes
+        finally:
+            self._unlock(fd)
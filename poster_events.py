@@ -0,0 +1,173 @@
+"""
+Подписка на изменения афиш через Postgres LISTEN/NOTIFY.
+
+Функции записи в db.py отправляют NOTIFY с id и версией афиши. Бот и API
+держат отдельное соединение с LISTEN и обновляют свои кеши афиш на месте,
+без опроса базы. После каждого подключения, включая первое, вызывается
+on_reconnect, чтобы перечитать афиши целиком: уведомления до LISTEN и во
+время разрыва теряются, а перечитывание после LISTEN ничего не пропускает.
+Соединение периодически проверяется запросом, чтобы полуоткрытый сокет
+тоже приводил к переподключению.
+
+API дальше раздаёт изменения клиентам мини-приложения через PosterEventHub.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import asyncpg
+
+from db import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER, POSTER_CHANGES_CHANNEL
+
+logger = logging.getLogger("TusaBot")
+
+RECONNECT_DELAY_SECONDS = 1.0
+RECONNECT_DELAY_MAX_SECONDS = 30.0
+# Сколько при старте ждать первой загрузки афиш через слушателя
+LISTEN_READY_TIMEOUT_SECONDS = 10.0
+# Проверка соединения LISTEN запросом SELECT 1, если уведомлений давно не было
+LISTEN_KEEPALIVE_SECONDS = 30.0
+LISTEN_KEEPALIVE_TIMEOUT_SECONDS = 5.0
+
+
+class PosterChangeListener:
+    """Слушатель канала poster_changes с автоматическим переподключением"""
+
+    def __init__(
+        self,
+        on_change: Callable[[Dict[str, Any]], Awaitable[None]],
+        on_reconnect: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
+        self._on_change = on_change
+        self._on_reconnect = on_reconnect
+        # Уведомления обрабатываются строго по порядку одной задачей
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        # LISTEN установлен и on_reconnect после него отработал
+        self._ready = asyncio.Event()
+
+    async def wait_ready(self, timeout: float = LISTEN_READY_TIMEOUT_SECONDS) -> bool:
+        """Дождаться первого подключения и загрузки. False, если не успели за timeout"""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._listen_forever()),
+            asyncio.create_task(self._dispatch_forever()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _on_notify(self, conn, pid, channel, payload: str) -> None:
+        try:
+            self._events.put_nowait(json.loads(payload))
+        except ValueError:
+            logger.warning("Malformed poster change payload: %r", payload)
+
+    async def _listen_forever(self) -> None:
+        delay = RECONNECT_DELAY_SECONDS
+        while True:
+            conn = None
+            try:
+                # Отдельное соединение: LISTEN нельзя держать на соединении из пула
+                conn = await asyncpg.connect(
+                    host=DB_HOST,
+                    port=DB_PORT,
+                    database=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                )
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(POSTER_CHANGES_CHANNEL, self._on_notify)
+                logger.info("Listening for poster changes on '%s'", POSTER_CHANGES_CHANNEL)
+
+                if self._on_reconnect:
+                    await self._on_reconnect()
+                self._ready.set()
+                delay = RECONNECT_DELAY_SECONDS
+
+                await self._keepalive(conn, lost)
+                logger.warning("Poster change listener connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Poster change listener failed: %s", e)
+            finally:
+                if conn is not None:
+                    await self._close(conn)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX_SECONDS)
+
+    async def _keepalive(self, conn: asyncpg.Connection, lost: asyncio.Event) -> None:
+        """Ждать разрыва, проверяя соединение запросом раз в LISTEN_KEEPALIVE_SECONDS.
+
+        Полуоткрытый сокет не вызывает termination listener, и без проверки
+        слушатель молча пропускал бы уведомления. Исключение — соединение мертво.
+        """
+        while not lost.is_set():
+            try:
+                await asyncio.wait_for(lost.wait(), timeout=LISTEN_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await asyncio.wait_for(conn.fetchval("SELECT 1"), timeout=LISTEN_KEEPALIVE_TIMEOUT_SECONDS)
+
+    async def _close(self, conn: asyncpg.Connection) -> None:
+        """Снять обработчик и закрыть соединение; повторный вызов безопасен"""
+        try:
+            if not conn.is_closed():
+                await conn.remove_listener(POSTER_CHANGES_CHANNEL, self._on_notify)
+                await conn.close(timeout=LISTEN_KEEPALIVE_TIMEOUT_SECONDS)
+        except Exception:
+            # Сокет уже не отвечает: закрываем без обмена с сервером
+            conn.terminate()
+
+    async def _dispatch_forever(self) -> None:
+        while True:
+            event = await self._events.get()
+            try:
+                await self._on_change(event)
+            except Exception as e:
+                logger.warning("Failed to apply poster change %s: %s", event, e)
+
+
+class PosterEventHub:
+    """Раздача изменений афиш открытым SSE-подключениям.
+
+    Один слушатель БД на процесс публикует событие сюда, а каждое
+    подключение читает свою очередь. Если клиент не успевает читать,
+    его очередь сбрасывается и он получает событие resync.
+    """
+
+    def __init__(self, max_queue: int = 100) -> None:
+        self._max_queue = max_queue
+        self._subscribers: set[asyncio.Queue] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._max_queue)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"op": "resync"})
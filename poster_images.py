@@ -0,0 +1,110 @@
+"""
+Обработка фото афиш: уменьшенные копии и WebP для веб-приложения.
+
+После загрузки фото в project/public/posters/ бот отдаёт его в пул
+процессов: Pillow держит GIL на ресайзе, поэтому потоки бы не помогли.
+Для каждой ширины из POSTER_IMAGE_WIDTHS (не больше исходной) пишутся JPEG
+и WebP без EXIF и прочих метаданных. Результат — размеры исходного фото и
+список вариантов, который сохраняется в posters.photo_variants.
+
+Исходники хранятся по хешу содержимого (см. poster_storage), поэтому
+уже нарезанные для того же фото варианты повторно не пересчитываются.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from poster_storage import local_path
+
+logger = logging.getLogger("TusaBot")
+
+POSTER_IMAGE_WIDTHS = tuple(
+    int(w) for w in os.getenv("POSTER_IMAGE_WIDTHS", "320,640,1080").split(",") if w.strip()
+)
+POSTER_IMAGE_WORKERS = int(os.getenv("POSTER_IMAGE_WORKERS", "2"))
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+
+def render_variants(web_path: str) -> Dict[str, Any]:
+    """Нарезать варианты фото. Выполняется в дочернем процессе"""
+    from PIL import Image, ImageOps
+
+    source = local_path(web_path)
+    with Image.open(source) as image:
+        # Поворачиваем по EXIF до того, как метаданные будут отброшены
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    width, height = image.size
+
+    widths = sorted({w for w in POSTER_IMAGE_WIDTHS if w < width} | {width})
+    variants = []
+    for target_width in widths:
+        target_height = round(height * target_width / width)
+        stem = f"{source.stem}_{target_width}"
+        jpeg_name = f"{stem}.jpg"
+        webp_name = f"{stem}.webp"
+        jpeg_path = source.with_name(jpeg_name)
+        webp_path = source.with_name(webp_name)
+        if not (jpeg_path.exists() and webp_path.exists()):
+            if target_width == width:
+                resized = image
+            else:
+                resized = image.resize((target_width, target_height), Image.LANCZOS)
+            # Сохраняем без exif/icc: Pillow пишет метаданные только если их передать явно.
+            # Через временный файл, чтобы проверка exists() выше не приняла недописанный файл
+            for path, fmt, options in (
+                (jpeg_path, "JPEG", {"quality": JPEG_QUALITY, "optimize": True, "progressive": True}),
+                (webp_path, "WEBP", {"quality": WEBP_QUALITY, "method": 6}),
+            ):
+                tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+                resized.save(tmp_path, fmt, **options)
+                os.replace(tmp_path, path)
+        base = web_path.rsplit("/", 1)[0]
+        variants.append({
+            "width": target_width,
+            "height": target_height,
+            "jpeg": f"{base}/{jpeg_name}",
+            "webp": f"{base}/{webp_name}",
+        })
+    return {"width": width, "height": height, "variants": variants}
+
+
+class PosterImagePipeline:
+    """Фоновая нарезка фото в пуле процессов; задачи доступны по веб-пути"""
+
+    def __init__(self, workers: int = POSTER_IMAGE_WORKERS) -> None:
+        self._workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: dict[str, asyncio.Future] = {}
+
+    def start(self, web_path: str) -> asyncio.Future:
+        """Начать обработку фото сразу после загрузки"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(self._executor, render_variants, web_path)
+        self._tasks[web_path] = task
+        return task
+
+    async def result(self, web_path: str) -> Optional[Dict[str, Any]]:
+        """Дождаться результата обработки. None, если фото не обрабатывалось или обработка упала"""
+        task = self._tasks.pop(web_path, None)
+        if task is None:
+            return None
+        try:
+            return await task
+        except Exception as e:
+            logger.warning("Failed to render poster variants for %s: %s", web_path, e)
+            return None
+
+    def in_flight(self) -> set[str]:
+        """Веб-пути фото, нарезка которых ещё не забрана через result()"""
+        return set(self._tasks)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
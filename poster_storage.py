@@ -0,0 +1,93 @@
+"""
+Хранение файлов афиш по хешу содержимого.
+
+Имя файла — первые 32 символа SHA-256 от содержимого, поэтому одинаковые
+фото хранятся один раз, а файл по конкретному адресу никогда не меняется и
+может кешироваться навсегда. Уменьшенные копии называются по имени
+исходника (<hash>_<width>.webp) и тоже неизменны.
+
+Файл удаляется, только когда на него не ссылается ни одна строка posters
+и ни один ещё не сохранённый черновик: счётчик ссылок не хранится
+отдельно, а считается запросом к таблице, черновики передаёт вызывающий.
+"""
+
+import hashlib
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Collection, Optional
+
+import asyncpg
+
+from db import count_poster_file_refs
+
+logger = logging.getLogger("TusaBot")
+
+PUBLIC_DIR = Path(__file__).parent / "project" / "public"
+POSTERS_DIR = PUBLIC_DIR / "posters"
+
+# <hash>.jpg и варианты <hash>_<width>.webp
+CONTENT_ADDRESSED_NAME = re.compile(r"^[0-9a-f]{32}(?:_\d+)?\.(?:jpe?g|png|webp)$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def local_path(web_path: str) -> Path:
+    """Путь на диске для веб-пути вида /posters/name.jpg"""
+    return PUBLIC_DIR / web_path.lstrip("/")
+
+
+def is_content_addressed(filename: str) -> bool:
+    return bool(CONTENT_ADDRESSED_NAME.match(filename))
+
+
+def save_poster_bytes(data: bytes, ext: str) -> str:
+    """Сохранить фото под именем из хеша и вернуть веб-путь. Повторная загрузка не пишет файл заново"""
+    POSTERS_DIR.mkdir(parents=True, exist_ok=True)
+    name = f"{hashlib.sha256(data).hexdigest()[:32]}.{ext.lower()}"
+    path = POSTERS_DIR / name
+    if path.exists():
+        logger.info("Poster photo %s already stored, reusing it", name)
+    else:
+        # Пишем во временный файл и переименовываем: читатели не увидят половину файла
+        tmp_path = path.with_name(f".{name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    return f"/posters/{name}"
+
+
+def remove_variants(variants: Optional[list]) -> None:
+    """Удалить файлы вариантов афиши с диска"""
+    for variant in variants or []:
+        for key in ("jpeg", "webp"):
+            try:
+                local_path(variant[key]).unlink(missing_ok=True)
+            except Exception as e:
+                logger.warning("Failed to delete poster variant %s: %s", variant.get(key), e)
+
+
+async def release_poster_files(
+    pool: asyncpg.Pool,
+    web_path: str,
+    variants: Optional[list] = None,
+    pending: Collection[str] = (),
+) -> bool:
+    """Удалить фото и его варианты, если на них не ссылается ни одна афиша и ни один черновик из pending"""
+    if not (web_path.startswith("/posters/") or web_path.startswith("posters/")):
+        return False
+    if web_path in pending or await count_poster_file_refs(pool, web_path):
+        return False
+    source = local_path(web_path)
+    try:
+        source.unlink(missing_ok=True)
+        logger.info("Deleted photo file: %s", web_path)
+    except Exception as e:
+        logger.error("Failed to delete photo file %s: %s", web_path, e)
+    remove_variants(variants)
+    if is_content_addressed(source.name):
+        # Варианты того же фото, нарезанные для черновика, но не записанные в афишу
+        for path in source.parent.glob(f"{source.stem}_*"):
+            if is_content_addressed(path.name):
+                path.unlink(missing_ok=True)
+    return True
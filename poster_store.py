@@ -0,0 +1,97 @@
+"""
+Хранилище активных афиш в памяти.
+
+Афиши лежат в словаре по id, а порядок (от старых к новым) задаёт
+отсортированный список id. Поиск афиши — O(1), позиция и соседи — O(log n)
+через bisect. Версия растёт при каждом изменении, поэтому по ней можно
+понять, устарели ли вычисленные ранее данные.
+
+Отдельная версия публикации растёт только когда появляется новая самая
+свежая афиша: по ней пользовательские курсоры лениво возвращаются к новинке.
+"""
+
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+Poster = Dict[str, Any]
+
+
+class PosterStore:
+    """Активные афиши по id с упорядоченным индексом и версией"""
+
+    def __init__(self, posters: Iterable[Poster] = ()) -> None:
+        self._by_id: dict[int, Poster] = {}
+        self._order: list[int] = []
+        self.version = 0
+        self.published_version = 0
+        self.replace_all(posters)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __contains__(self, poster_id: int) -> bool:
+        return poster_id in self._by_id
+
+    def __iter__(self) -> Iterator[Poster]:
+        """Афиши от старых к новым"""
+        return (self._by_id[poster_id] for poster_id in self._order)
+
+    def __reversed__(self) -> Iterator[Poster]:
+        """Афиши от новых к старым"""
+        return (self._by_id[poster_id] for poster_id in reversed(self._order))
+
+    def get(self, poster_id: int) -> Optional[Poster]:
+        return self._by_id.get(poster_id)
+
+    def latest(self) -> Optional[Poster]:
+        return self._by_id[self._order[-1]] if self._order else None
+
+    def _latest_id(self) -> Optional[int]:
+        return self._order[-1] if self._order else None
+
+    def replace_all(self, posters: Iterable[Poster]) -> None:
+        latest_id = self._latest_id()
+        self._by_id = {poster["id"]: poster for poster in posters}
+        self._order = sorted(self._by_id)
+        self.version += 1
+        if self._order and (latest_id is None or self._order[-1] > latest_id):
+            self.published_version += 1
+
+    def upsert(self, poster: Poster) -> None:
+        poster_id = poster["id"]
+        if poster_id not in self._by_id:
+            latest_id = self._latest_id()
+            insort(self._order, poster_id)
+            if latest_id is None or poster_id > latest_id:
+                self.published_version += 1
+        self._by_id[poster_id] = poster
+        self.version += 1
+
+    def remove(self, poster_id: int) -> Optional[Poster]:
+        poster = self._by_id.pop(poster_id, None)
+        if poster is not None:
+            del self._order[bisect_left(self._order, poster_id)]
+            self.version += 1
+        return poster
+
+    def index(self, poster_id: int) -> int:
+        """Позиция афиши (0 — самая старая). Афиша должна быть в хранилище"""
+        return bisect_left(self._order, poster_id)
+
+    def neighbours(self, poster_id: int) -> tuple[Optional[int], Optional[int]]:
+        """id предыдущей (более старой) и следующей (более новой) афиши"""
+        pos = bisect_left(self._order, poster_id)
+        prev_id = self._order[pos - 1] if pos > 0 else None
+        if pos < len(self._order) and self._order[pos] == poster_id:
+            pos += 1
+        next_id = self._order[pos] if pos < len(self._order) else None
+        return prev_id, next_id
+
+    def nearest(self, poster_id: int) -> Optional[Poster]:
+        """Афиша с этим id, а если её удалили — ближайшая более новая (или самая новая)"""
+        if poster_id in self._by_id:
+            return self._by_id[poster_id]
+        if not self._order:
+            return None
+        pos = bisect_left(self._order, poster_id)
+        return self._by_id[self._order[min(pos, len(self._order) - 1)]]
@@ -14,11 +14,66 @@ function App() {
     fetchPosters();
   }, []);
 
+  // Живые обновления афиш через SSE: новые афиши появляются без перезапуска
+  useEffect(() => {
+    const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+    const source = new EventSource(`${apiUrl}/posters/events`);
+    let connected = false;
+
+    const upsertPoster = (e: MessageEvent) => {
+      const { poster } = JSON.parse(e.data);
+      setPosters((prev) =>
+        // Новые афиши первыми, как в ответе /posters: по created_at, затем по id
+        [...prev.filter((p) => p.id !== poster.id), poster as Poster].sort(
+          (a, b) => Date.parse(b.created_at) - Date.parse(a.created_at) || b.id - a.id
+        )
+      );
+    };
+    const removePoster = (e: MessageEvent) => {
+      const { id } = JSON.parse(e.data);
+      setPosters((prev) => prev.filter((p) => p.id !== id));
+    };
+
+    source.addEventListener('ready', () => {
+      // После переподключения события за время разрыва потеряны — перечитываем список
+      if (connected) fetchPosters();
+      connected = true;
+    });
+    source.addEventListener('create', upsertPoster);
+    source.addEventListener('update', upsertPoster);
+    source.addEventListener('delete', removePoster);
+    source.addEventListener('resync', () => fetchPosters());
+
+    return () => source.close();
+  }, []);
+
+  // Текущая афиша могла быть удалена
+  useEffect(() => {
+    if (currentIndex > 0 && currentIndex >= posters.length) {
+      setCurrentIndex(Math.max(posters.length - 1, 0));
+    }
+  }, [posters, currentIndex]);
+
+  // Список афиш из статического манифеста: его отдаёт nginx (gzip, ETag) без обращения к API.
+  // Если манифеста нет (локальная разработка), читаем /posters
+  async function loadPosters(): Promise<Poster[]> {
+    const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+    try {
+      const response = await fetch(`${apiUrl}/posters.json`, { cache: 'no-cache' });
+      if (response.ok) {
+        return (await response.json()) as Poster[];
+      }
+    } catch (err) {
+      console.warn('posters.json unavailable, falling back to /posters:', err);
+    }
+    return getPosters();
+  }
+
   async function fetchPosters() {
     console.log('Fetching posters from API...');
     console.log('API URL:', import.meta.env.VITE_API_URL || 'http://localhost:8000');
     try {
-      const data = await getPosters();
+      const data = await loadPosters();
       console.log('API response:', data);
       
       // Логируем каждую афишу для отладки
@@ -77,6 +132,16 @@ function App() {
 
   const currentPoster = posters[currentIndex] || null;
 
+  // Добавляет адрес API к каждому URL в srcset ("/posters/a_320.webp 320w, ...")
+  const withApiUrl = (srcset: string | undefined) => {
+    if (!srcset) return undefined;
+    const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+    return srcset
+      .split(', ')
+      .map((candidate) => `${apiUrl}${candidate}`)
+      .join(', ');
+  };
+
   return (
     <div className="min-h-screen bg-gradient-to-br from-[#0b1220] via-[#1a1640] to-[#2b0f4f] text-white">
       <main className="relative max-w-md mx-auto min-h-screen overflow-hidden" style={{ touchAction: 'pan-y' }}>
@@ -129,7 +194,19 @@ function App() {
                 onTouchMove={handleTouchMove}
                 onTouchEnd={handleTouchEnd}
               >
+                <picture>
+                {withApiUrl((currentPoster as any).srcset_webp) && (
+                  <source
+                    type="image/webp"
+                    srcSet={withApiUrl((currentPoster as any).srcset_webp)}
+                    sizes="(max-width: 448px) 100vw, 448px"
+                  />
+                )}
                 <img
+                  srcSet={withApiUrl((currentPoster as any).srcset)}
+                  sizes="(max-width: 448px) 100vw, 448px"
+                  width={(currentPoster as any).photo_width || undefined}
+                  height={(currentPoster as any).photo_height || undefined}
                   src={(() => {
                     const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
                     const photoUrl = (currentPoster as any).photo_url || `/photo/${currentPoster.file_id}`;
@@ -149,9 +226,12 @@ function App() {
                       fullUrl: `${apiUrl}${photoUrl}`
                     });
                     // Если не удалось загрузить, показываем заглушку
+                    e.currentTarget.parentElement?.querySelector('source')?.remove();
+                    e.currentTarget.removeAttribute('srcset');
                     e.currentTarget.src = '/фон.jpg';
                   }}
                 />
+                </picture>
               </div>
 
               {/* Описание по центру */}
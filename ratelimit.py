@@ -0,0 +1,95 @@
+"""
+Ограничение частоты запросов к публичным эндпоинтам по IP клиента.
+
+Каждому IP — ведро токенов на маршрут: ведро пополняется со скоростью
+rate в секунду до burst, запрос забирает один токен, пустое ведро — 429 с
+Retry-After. IP берётся из X-Real-IP, который выставляет nginx, но только
+если запрос пришёл с localhost: напрямую заголовок подделать нельзя.
+
+Вёдра живут в памяти процесса; давно не использованные вытесняются, когда
+клиентов больше max_clients, так что память ограничена и при сканировании
+с множества адресов.
+
+У каждого воркера uvicorn свои вёдра, и без поправки N воркеров пропускали
+бы N бюджетов на IP. Поэтому скорость и пачка делятся на API_WORKERS:
+соединения распределяются по воркерам примерно поровну, и в сумме клиент
+получает настроенный бюджет.
+"""
+
+import math
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+
+from metrics import Counter
+
+TRUSTED_PROXIES = frozenset(("127.0.0.1", "::1"))
+
+# Бюджеты в запросах в минуту и размер пачки на один IP
+PHOTO_RATE_PER_MINUTE = float(os.getenv("PHOTO_RATE_PER_MINUTE", "60"))
+PHOTO_RATE_BURST = int(os.getenv("PHOTO_RATE_BURST", "30"))
+POSTERS_RATE_PER_MINUTE = float(os.getenv("POSTERS_RATE_PER_MINUTE", "120"))
+POSTERS_RATE_BURST = int(os.getenv("POSTERS_RATE_BURST", "40"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "50000"))
+# Число воркеров uvicorn (тот же API_WORKERS, что в systemd-юните)
+API_WORKERS = max(1, int(os.getenv("API_WORKERS", "1")))
+
+RATE_LIMITED = Counter("tusabot_rate_limited_total", "Запросы, отклонённые ограничением частоты", ("limit",))
+
+
+def client_ip(request: Request) -> str:
+    """IP клиента: X-Real-IP от nginx или адрес соединения"""
+    peer = request.client.host if request.client else ""
+    if peer in TRUSTED_PROXIES:
+        return request.headers.get("x-real-ip") or peer
+    return peer
+
+
+class TokenBucketLimiter:
+    """Ведро токенов на каждого клиента"""
+
+    def __init__(self, name: str, per_minute: float, burst: int,
+                 max_clients: int = RATE_LIMIT_MAX_CLIENTS) -> None:
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        # Ключ -> (токены, время последнего пополнения), от давних клиентов к недавним
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def acquire(self, key: str) -> float:
+        """Забрать токен. 0 — можно, иначе сколько секунд ждать следующего"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate if self.rate > 0 else 60.0
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def __call__(self, request: Request) -> None:
+        """Зависимость FastAPI: 429, если клиент исчерпал бюджет"""
+        wait = self.acquire(client_ip(request))
+        if wait:
+            RATE_LIMITED.inc((self.name,))
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, round(wait)))},
+            )
+
+
+def per_worker_limiter(name: str, per_minute: float, burst: int, workers: int = API_WORKERS) -> TokenBucketLimiter:
+    """Ограничитель с долей общего бюджета на один воркер"""
+    return TokenBucketLimiter(name, per_minute / workers, max(1, math.ceil(burst / workers)))
+
+
+photo_limiter = per_worker_limiter("photo", PHOTO_RATE_PER_MINUTE, PHOTO_RATE_BURST)
+posters_limiter = per_worker_limiter("posters", POSTERS_RATE_PER_MINUTE, POSTERS_RATE_BURST)
@@ -0,0 +1,151 @@
+"""
+Кодирование ответов API: быстрый JSON и сжатие по Accept-Encoding.
+
+ORJSONResponse сериализует ответы через orjson вместо стандартного json.
+CompressionMiddleware сжимает JSON и текстовые ответы в brotli (если
+установлен пакет brotli) или gzip — что клиент предпочитает. Ответы с
+ETag — это версии одного и того же содержимого, поэтому их сжатые тела
+кешируются по (путь, ETag, кодировка): снимок афиш сжимается один раз на
+версию и дальше отдаётся готовым. Потоки (SSE) и файлы не трогаются.
+"""
+
+import gzip
+import os
+from collections import OrderedDict
+from typing import Any, Optional
+
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # без brotli сжимаем только gzip
+    brotli = None
+
+# Ответы меньше этого размера не сжимаем: заголовки съедят выигрыш
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "512"))
+COMPRESSED_CACHE_ENTRIES = int(os.getenv("COMPRESSED_CACHE_ENTRIES", "256"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON-ответ, сериализованный через orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Выбрать br или gzip по заголовку Accept-Encoding (с учётом q=0)"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(candidates, key=lambda name: accepted.get(name, accepted.get("*", 0.0)))
+    if accepted.get(best, accepted.get("*", 0.0)) <= 0:
+        return None
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0: одинаковое тело всегда сжимается в одинаковые байты
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """ASGI-middleware сжатия ответов с кешем сжатых тел по ETag"""
+
+    def __init__(self, app: ASGIApp, min_size: int = COMPRESS_MIN_BYTES,
+                 cache_entries: int = COMPRESSED_CACHE_ENTRIES) -> None:
+        self.app = app
+        self.min_size = min_size
+        self.cache_entries = cache_entries
+        self._cache: OrderedDict[tuple, bytes] = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        chunks: list[bytes] = []
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "").split(";")[0].strip()
+                if content_type not in COMPRESSIBLE_TYPES or "content-encoding" in headers:
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            await self._send_buffered(scope, start, b"".join(chunks), encoding, send)
+
+        await self.app(scope, receive, send_compressed)
+
+    async def _send_buffered(self, scope: Scope, start: Message, body: bytes,
+                             encoding: str, send: Send) -> None:
+        headers = MutableHeaders(raw=start["headers"])
+        if len(body) < self.min_size or start["status"] in (204, 304):
+            if body:
+                headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        etag = headers.get("etag")
+        key = (scope["path"], scope.get("query_string", b""), etag, encoding)
+        compressed = self._cache.get(key) if etag else None
+        if compressed is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+        else:
+            compressed = compress(body, encoding)
+            if etag:
+                self.cache_misses += 1
+                self._cache[key] = compressed
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+
+        headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        if etag and not etag.startswith("W/"):
+            # Сжатое тело отличается побайтно: строгий ETag становится слабым, как у nginx
+            headers["ETag"] = f"W/{etag}"
+        await send(start)
+        await send({"type": "http.response.body", "body": compressed})
@@ -0,0 +1,124 @@
+"""
+Кешированная сводка посещаемости по всем афишам.
+
+Полная сводка строится одним сгруппированным запросом по посещениям с
+id не больше MAX(id) - ROLLUP_OVERLAP_IDS, более свежие строки дочитываются
+по одной. id из SERIAL выдаётся при вставке, а виден становится при
+коммите, поэтому строка с меньшим id может появиться позже большей: каждое
+обновление перечитывает окно из последних ROLLUP_OVERLAP_IDS id и
+пропускает уже учтённые строки. Периодически сводка пересчитывается
+целиком, чтобы учесть удаления.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict
+
+import asyncpg
+
+from db import get_attendance_rollup, get_attendances_after, get_max_attendance_id
+
+logger = logging.getLogger("TusaBot")
+
+ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", "30"))
+ROLLUP_FULL_REFRESH_SECONDS = float(os.getenv("ROLLUP_FULL_REFRESH_SECONDS", "600"))
+# Сколько последних id перечитывать, чтобы не потерять поздно закоммиченные строки
+ROLLUP_OVERLAP_IDS = int(os.getenv("ROLLUP_OVERLAP_IDS", "1000"))
+
+ROLLUP_COUNTERS = (
+    "total_attendees",
+    "male_count",
+    "female_count",
+    "age_under_18",
+    "age_18_24",
+    "age_25_34",
+    "age_35_plus",
+)
+
+
+class AttendanceRollup:
+    """Сводка посещаемости poster_id -> счётчики с инкрементальным обновлением"""
+
+    def __init__(self, overlap_ids: int = ROLLUP_OVERLAP_IDS) -> None:
+        self._by_poster: dict[int, dict[str, int]] = {}
+        self._overlap_ids = overlap_ids
+        # Все посещения с id <= _base_id учтены полным пересчётом
+        self._base_id = 0
+        self._last_id = 0
+        # Учтённые id из окна перечитывания
+        self._counted_ids: set[int] = set()
+        self._refreshed_at = 0.0
+        self._full_refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _counters(self, poster_id: int) -> dict[str, int]:
+        return self._by_poster.setdefault(poster_id, dict.fromkeys(ROLLUP_COUNTERS, 0))
+
+    def _merge(self, rows: list[Dict[str, Any]]) -> None:
+        for row in rows:
+            counters = self._counters(row["poster_id"])
+            for key in ROLLUP_COUNTERS:
+                counters[key] += row[key]
+
+    def _count(self, rows: list[Dict[str, Any]]) -> None:
+        """Учесть отдельные посещения, пропуская уже учтённые (те же правила, что в SQL сводки)"""
+        for row in rows:
+            if row["id"] in self._counted_ids:
+                continue
+            self._counted_ids.add(row["id"])
+            self._last_id = max(self._last_id, row["id"])
+            counters = self._counters(row["poster_id"])
+            counters["total_attendees"] += 1
+            if row["gender"] == "male":
+                counters["male_count"] += 1
+            elif row["gender"] == "female":
+                counters["female_count"] += 1
+            age = row["age"]
+            if age is None:
+                continue
+            if age < 18:
+                counters["age_under_18"] += 1
+            elif age <= 24:
+                counters["age_18_24"] += 1
+            elif age <= 34:
+                counters["age_25_34"] += 1
+            else:
+                counters["age_35_plus"] += 1
+
+    def _window_start(self) -> int:
+        return max(self._base_id, self._last_id - self._overlap_ids)
+
+    async def refresh(self, pool: asyncpg.Pool, full: bool = False) -> None:
+        """Дочитать новые посещения (или пересчитать сводку целиком)"""
+        async with self._lock:
+            now = time.monotonic()
+            if full or now - self._full_refreshed_at >= ROLLUP_FULL_REFRESH_SECONDS:
+                base_id = max(0, await get_max_attendance_id(pool) - self._overlap_ids)
+                rows = await get_attendance_rollup(pool, up_to_id=base_id)
+                self._by_poster = {}
+                self._base_id = self._last_id = base_id
+                self._counted_ids = set()
+                self._merge(rows)
+                self._full_refreshed_at = now
+            self._count(await get_attendances_after(pool, self._window_start()))
+            # id ниже окна больше не перечитываются, помнить их незачем
+            window_start = self._window_start()
+            self._counted_ids = {i for i in self._counted_ids if i > window_start}
+            self._refreshed_at = now
+
+    async def get(self, pool: asyncpg.Pool) -> dict[int, dict[str, int]]:
+        """Получить сводку, обновив её если она старше ROLLUP_REFRESH_SECONDS"""
+        if time.monotonic() - self._refreshed_at >= ROLLUP_REFRESH_SECONDS:
+            try:
+                await self.refresh(pool)
+            except Exception as e:
+                if not self._refreshed_at:
+                    raise
+                logger.warning("Failed to refresh attendance rollup, serving cached: %s", e)
+        return {poster_id: dict(counters) for poster_id, counters in self._by_poster.items()}
+
+    def drop_poster(self, poster_id: int) -> None:
+        """Убрать удалённую афишу из сводки"""
+        self._by_poster.pop(poster_id, None)
@@ -33,7 +33,9 @@ pip install -r requirements.txt
 
 echo "🗄️ Running database migrations..."
 export PGPASSWORD="${DB_PASSWORD}"
-psql -h ${DB_HOST} -U ${DB_USER} -d ${DB_NAME} -f migrations/001_initial_schema.sql || true
+for migration in migrations/*.sql; do
+    psql -h ${DB_HOST} -U ${DB_USER} -d ${DB_NAME} -f "$migration" || true
+done
 
 echo "📦 Building web application..."
 cd project
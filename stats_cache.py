@@ -0,0 +1,80 @@
+"""
+Снимок общей статистики для публичного /stats.
+
+Статистику считает фоновая задача раз в STATS_REFRESH_SECONDS или сразу
+после invalidate() (но не чаще STATS_MIN_REFRESH_SECONDS). Запросы читают
+готовый снимок и никогда не обращаются к БД; исключение — самый первый
+запрос, если при старте снимок построить не удалось. Одновременные
+обновления объединяются в одно.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("TusaBotAPI")
+
+STATS_REFRESH_SECONDS = float(os.getenv("STATS_REFRESH_SECONDS", "60"))
+STATS_MIN_REFRESH_SECONDS = float(os.getenv("STATS_MIN_REFRESH_SECONDS", "5"))
+
+
+class StatsCache:
+    """Периодически обновляемый снимок статистики"""
+
+    def __init__(self, load: Callable[[], Awaitable[Dict[str, Any]]]) -> None:
+        self._load = load
+        self._data: Optional[Dict[str, Any]] = None
+        self._refreshed_at = 0.0
+        self._refreshing: Optional[asyncio.Future] = None
+        self._invalidated = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._refresh_forever())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def invalidate(self) -> None:
+        """Пересчитать статистику в ближайшее время (например, после изменения афиш)"""
+        self._invalidated.set()
+
+    async def refresh(self) -> None:
+        """Пересчитать статистику; параллельные вызовы ждут один общий запрос"""
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._refresh_once())
+            self._refreshing.add_done_callback(self._refresh_done)
+        # shield: отмена одного запроса не должна обрывать обновление для остальных
+        await asyncio.shield(self._refreshing)
+
+    async def _refresh_once(self) -> None:
+        self._data = await self._load()
+        self._refreshed_at = time.monotonic()
+
+    def _refresh_done(self, _: asyncio.Future) -> None:
+        self._refreshing = None
+
+    async def get(self) -> Dict[str, Any]:
+        """Снимок статистики с его возрастом в секундах"""
+        if self._data is None:
+            await self.refresh()
+        return {**self._data, "age_seconds": round(time.monotonic() - self._refreshed_at, 1)}
+
+    async def _refresh_forever(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("Failed to refresh stats: %s", e)
+            self._invalidated.clear()
+            try:
+                await asyncio.wait_for(self._invalidated.wait(), timeout=STATS_REFRESH_SECONDS)
+                # Серию изменений подряд схлопываем в одно обновление
+                await asyncio.sleep(STATS_MIN_REFRESH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,58 @@
+import pytest
+
+from checkin import AttendanceQueue, InvalidCheckinToken, issue_checkin_token, verify_checkin_token
+
+
+@pytest.fixture(autouse=True)
+def checkin_secret(monkeypatch):
+    monkeypatch.setenv("CHECKIN_SECRET", "test-secret")
+
+
+def test_token_round_trip():
+    token = issue_checkin_token(123456789, 42, ttl_hours=1)
+    claims = verify_checkin_token(token)
+    assert (claims.tg_id, claims.poster_id) == (123456789, 42)
+
+
+def test_tampered_token_is_rejected():
+    payload, signature = issue_checkin_token(1, 2, ttl_hours=1).split(".")
+    other_payload = issue_checkin_token(1, 3, ttl_hours=1).split(".")[0]
+    with pytest.raises(InvalidCheckinToken):
+        verify_checkin_token(f"{other_payload}.{signature}")
+
+
+def test_token_signed_with_other_secret_is_rejected(monkeypatch):
+    token = issue_checkin_token(1, 2, ttl_hours=1)
+    monkeypatch.setenv("CHECKIN_SECRET", "another-secret")
+    with pytest.raises(InvalidCheckinToken):
+        verify_checkin_token(token)
+
+
+def test_expired_token_is_rejected():
+    token = issue_checkin_token(1, 2, ttl_hours=1)
+    claims = verify_checkin_token(token)
+    with pytest.raises(InvalidCheckinToken):
+        verify_checkin_token(token, now=claims.expires_at + 1)
+
+
+@pytest.mark.parametrize("token", ["", "garbage", "a.b", "!!!.???"])
+def test_malformed_token_is_rejected(token):
+    with pytest.raises(InvalidCheckinToken):
+        verify_checkin_token(token)
+
+
+def test_queue_rejects_repeat_checkin():
+    queue = AttendanceQueue()
+    assert queue.add(1, 10)
+    assert not queue.add(1, 10)
+    assert queue.add(1, 11)
+    assert len(queue) == 2
+
+
+def test_queue_seen_set_is_bounded():
+    queue = AttendanceQueue(seen_max=3)
+    for tg_id in range(10):
+        queue.add(tg_id, 1)
+    assert len(queue._seen) == 3
+    # Ещё не записанные посещения по-прежнему считаются повтором
+    assert not queue.add(0, 1)
@@ -0,0 +1,32 @@
+import asyncio
+
+from health import HealthProber
+
+
+def _prober():
+    async def database():
+        raise ConnectionError("password authentication failed for user tusabot at 10.0.0.5")
+
+    async def telegram():
+        pass
+
+    return HealthProber({"database": database, "telegram": telegram}, required=("database", "telegram"))
+
+
+def test_public_results_hide_error_text():
+    prober = _prober()
+    asyncio.run(prober.probe())
+    public = prober.public_results()
+    assert public["database"]["ok"] is False
+    assert "error" not in public["database"]
+    assert "password" not in repr(public)
+    # Внутренние результаты (heartbeat бота) текст ошибки сохраняют
+    assert "password" in prober.results()["database"]["error"]
+
+
+def test_failing_lists_required_checks():
+    prober = _prober()
+    assert prober.failing() == ["database", "telegram"]
+    asyncio.run(prober.probe())
+    assert prober.failing() == ["database"]
+    assert not prober.is_ready()
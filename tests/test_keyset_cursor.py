@@ -0,0 +1,21 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from db import decode_keyset_cursor, encode_keyset_cursor
+
+
+def test_cursor_round_trip():
+    at = datetime(2026, 10, 19, 7, 50, 42, 858818, tzinfo=timezone(timedelta(hours=3)))
+    assert decode_keyset_cursor(encode_keyset_cursor(at, 12345)) == (at, 12345)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_keyset_cursor(datetime.now(timezone.utc), 1)
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+
+
+@pytest.mark.parametrize("cursor", ["", "zzz", "bm90LWEtZGF0ZXwx", "MjAyNi0xMC0xOVQwNzo1MDo0Mnx4"])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_keyset_cursor(cursor)
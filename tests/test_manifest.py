@@ -0,0 +1,53 @@
+import asyncio
+import gzip
+from types import SimpleNamespace
+
+import api
+from manifest import write_manifest
+from poster_store import PosterStore
+
+
+def test_manifest_and_gzip_are_written(tmp_path):
+    path = tmp_path / "posters.json"
+    assert write_manifest(b'[{"id": 1}]', path, version=5)
+    assert path.read_bytes() == b'[{"id": 1}]'
+    assert gzip.decompress((tmp_path / "posters.json.gz").read_bytes()) == b'[{"id": 1}]'
+
+
+def test_identical_manifest_is_not_rewritten(tmp_path):
+    path = tmp_path / "posters.json"
+    write_manifest(b"[]", path, version=1)
+    assert not write_manifest(b"[]", path, version=1)
+
+
+def test_older_version_does_not_overwrite_newer(tmp_path):
+    path = tmp_path / "posters.json"
+    write_manifest(b'[{"id": 2}]', path, version=10)
+    assert not write_manifest(b'[{"id": 1}]', path, version=9)
+    assert path.read_bytes() == b'[{"id": 2}]'
+    assert write_manifest(b'[{"id": 3}]', path, version=11)
+    assert path.read_bytes() == b'[{"id": 3}]'
+
+
+def test_reload_after_delete_overwrites_manifest(tmp_path, monkeypatch):
+    path = tmp_path / "posters.json"
+    # До перезапуска: афиши 1 (версия 3) и 2 (версия 7), затем удаление 2 (версия 8)
+    write_manifest(b'[{"id": 2}, {"id": 1}]', path, version=7)
+
+    async def active_posters(pool):
+        return [{"id": 1, "version": 3}]
+
+    async def change_version(pool):
+        return 8
+
+    monkeypatch.setattr(api, "db_pool", SimpleNamespace(primary=None))
+    monkeypatch.setattr(api, "get_active_posters", active_posters)
+    monkeypatch.setattr(api, "get_poster_change_version", change_version)
+    monkeypatch.setattr(api, "poster_cache", PosterStore())
+    monkeypatch.setattr(api, "poster_change_version", 0)
+    monkeypatch.setattr(api, "_posters_changed", lambda: None)
+    asyncio.run(api._reload_posters())
+
+    assert api.poster_change_version == 8
+    assert write_manifest(b'[{"id": 1}]', path, version=api.poster_change_version)
+    assert path.read_bytes() == b'[{"id": 1}]'
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import time
+
+import httpx
+
+import photo_cache
+from photo_cache import TelegramPhotoCache
+
+
+def telegram_transport(calls):
+    async def handler(request):
+        if request.url.path.endswith("/getFile"):
+            calls["getFile"] += 1
+            return httpx.Response(200, json={"ok": True, "result": {"file_path": "photos/x.jpg"}})
+        calls["download"] += 1
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=b"x" * 1000)
+
+    return httpx.MockTransport(handler)
+
+
+async def start_cache(cache_dir, calls, max_bytes=10_000):
+    cache = TelegramPhotoCache("token", cache_dir, max_bytes=max_bytes)
+    await cache.start()
+    await cache._client.aclose()
+    cache._client = httpx.AsyncClient(transport=telegram_transport(calls))
+    return cache
+
+
+def test_concurrent_misses_in_two_workers_download_once(tmp_path):
+    calls = {"getFile": 0, "download": 0}
+
+    async def scenario():
+        first = await start_cache(tmp_path, calls)
+        second = await start_cache(tmp_path, calls)
+        paths = await asyncio.gather(first.get("f1"), second.get("f1"), first.get("f1"))
+        assert len(set(paths)) == 1 and paths[0].read_bytes() == b"x" * 1000
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+    assert calls["download"] == 1
+
+
+def test_eviction_spares_recently_used_files(tmp_path, monkeypatch):
+    calls = {"getFile": 0, "download": 0}
+
+    async def scenario():
+        cache = await start_cache(tmp_path, calls, max_bytes=1500)
+        old = await cache.get("old")
+        past = time.time() - photo_cache.EVICT_GRACE_SECONDS - 10
+        os.utime(old, (past, past))
+        recent = await cache.get("recent")
+        # old устарел и вытеснен, recent только что скачан
+        assert not old.exists() and recent.exists()
+
+        again = await cache.get("again")
+        # Лимит снова превышен, но оба файла использованы недавно
+        assert recent.exists() and again.exists()
+        await cache.close()
+
+    asyncio.run(scenario())
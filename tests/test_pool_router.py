@@ -0,0 +1,31 @@
+import asyncio
+
+from db import PoolRouter
+
+
+def make_router():
+    primary, replica = object(), object()
+    router = PoolRouter(primary, replica)
+    router._lag_task.cancel()
+    router.replica_lag = 0.0
+    return router, primary, replica
+
+
+def test_write_sends_only_same_key_reads_to_primary():
+    async def scenario():
+        router, primary, replica = make_router()
+        router.mark_write(("user", 1))
+        assert router.reader(("user", 1)) is primary
+        assert router.reader(("user", 2)) is replica
+        assert router.reader() is replica
+
+    asyncio.run(scenario())
+
+
+def test_lagging_replica_is_not_used():
+    async def scenario():
+        router, primary, _ = make_router()
+        router.replica_lag = None
+        assert router.reader() is primary
+
+    asyncio.run(scenario())
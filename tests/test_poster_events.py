@@ -0,0 +1,134 @@
+import asyncio
+
+import poster_events
+from poster_events import PosterChangeListener, PosterEventHub
+
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.listeners = {}
+        self.alive = alive
+        self.closed = False
+
+    def add_termination_listener(self, callback):
+        pass
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    async def remove_listener(self, channel, callback):
+        self.listeners.pop(channel, None)
+
+    async def fetchval(self, query):
+        if not self.alive:
+            # Полуоткрытый сокет: ответа нет
+            await asyncio.sleep(3600)
+        return 1
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self, timeout=None):
+        self.closed = True
+
+    def terminate(self):
+        self.closed = True
+
+
+def test_first_connect_reloads_after_listen(monkeypatch):
+    conn = FakeConnection()
+    calls = []
+
+    async def connect(**kwargs):
+        return conn
+
+    async def on_reconnect():
+        # К моменту перечитывания LISTEN уже установлен
+        calls.append(poster_events.POSTER_CHANGES_CHANNEL in conn.listeners)
+
+    async def on_change(event):
+        pass
+
+    monkeypatch.setattr(poster_events.asyncpg, "connect", connect)
+
+    async def scenario():
+        listener = PosterChangeListener(on_change, on_reconnect=on_reconnect)
+        listener.start()
+        try:
+            assert await listener.wait_ready(timeout=1)
+        finally:
+            await listener.stop()
+
+    asyncio.run(scenario())
+    assert calls == [True]
+
+
+def test_failed_reload_closes_connection(monkeypatch):
+    connections = []
+
+    async def connect(**kwargs):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    async def on_reconnect():
+        if len(connections) < 3:
+            raise RuntimeError("db error")
+
+    async def on_change(event):
+        pass
+
+    monkeypatch.setattr(poster_events.asyncpg, "connect", connect)
+    monkeypatch.setattr(poster_events, "RECONNECT_DELAY_SECONDS", 0)
+
+    async def scenario():
+        listener = PosterChangeListener(on_change, on_reconnect=on_reconnect)
+        listener.start()
+        try:
+            assert await listener.wait_ready(timeout=1)
+        finally:
+            await listener.stop()
+
+    asyncio.run(scenario())
+    assert len(connections) == 3
+    assert all(conn.closed and not conn.listeners for conn in connections)
+
+
+def test_dead_connection_is_replaced_after_keepalive(monkeypatch):
+    connections = []
+
+    async def connect(**kwargs):
+        # Первое соединение полуоткрыто, следующие живые
+        connections.append(FakeConnection(alive=bool(connections)))
+        return connections[-1]
+
+    async def on_change(event):
+        pass
+
+    monkeypatch.setattr(poster_events.asyncpg, "connect", connect)
+    monkeypatch.setattr(poster_events, "RECONNECT_DELAY_SECONDS", 0)
+    monkeypatch.setattr(poster_events, "LISTEN_KEEPALIVE_SECONDS", 0.01)
+    monkeypatch.setattr(poster_events, "LISTEN_KEEPALIVE_TIMEOUT_SECONDS", 0.01)
+
+    async def scenario():
+        listener = PosterChangeListener(on_change)
+        listener.start()
+        try:
+            while len(connections) < 2:
+                await asyncio.sleep(0.01)
+        finally:
+            await listener.stop()
+
+    asyncio.run(scenario())
+    assert connections[0].closed
+
+
+def test_hub_resyncs_slow_subscriber():
+    async def scenario():
+        hub = PosterEventHub(max_queue=2)
+        queue = hub.subscribe()
+        for i in range(3):
+            hub.publish({"op": "update", "id": i})
+        assert queue.qsize() == 1
+        assert queue.get_nowait() == {"op": "resync"}
+
+    asyncio.run(scenario())
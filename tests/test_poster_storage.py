@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+import poster_storage
+
+
+@pytest.fixture
+def posters_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(poster_storage, "PUBLIC_DIR", tmp_path)
+    monkeypatch.setattr(poster_storage, "POSTERS_DIR", tmp_path / "posters")
+    return tmp_path / "posters"
+
+
+def use_refs(monkeypatch, count):
+    async def count_refs(pool, web_path):
+        return count
+
+    monkeypatch.setattr(poster_storage, "count_poster_file_refs", count_refs)
+
+
+def test_same_bytes_share_one_file(posters_dir):
+    first = poster_storage.save_poster_bytes(b"photo", "JPG")
+    second = poster_storage.save_poster_bytes(b"photo", "jpg")
+    assert first == second
+    assert poster_storage.is_content_addressed(first.rsplit("/", 1)[1])
+    assert len(list(posters_dir.iterdir())) == 1
+
+
+def test_release_removes_original_and_variants(posters_dir, monkeypatch):
+    use_refs(monkeypatch, 0)
+    web_path = poster_storage.save_poster_bytes(b"photo", "jpg")
+    stem = web_path.rsplit("/", 1)[1].split(".")[0]
+    (posters_dir / f"{stem}_320.webp").write_bytes(b"v")
+    (posters_dir / f"{stem}_320.jpg").write_bytes(b"v")
+
+    assert asyncio.run(poster_storage.release_poster_files(None, web_path))
+    assert list(posters_dir.iterdir()) == []
+
+
+def test_release_keeps_files_referenced_by_posters_or_drafts(posters_dir, monkeypatch):
+    web_path = poster_storage.save_poster_bytes(b"photo", "jpg")
+
+    use_refs(monkeypatch, 1)
+    assert not asyncio.run(poster_storage.release_poster_files(None, web_path))
+
+    use_refs(monkeypatch, 0)
+    assert not asyncio.run(poster_storage.release_poster_files(None, web_path, pending={web_path}))
+    assert poster_storage.local_path(web_path).exists()
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import api
+from db import decode_keyset_cursor
+from poster_store import PosterStore
+
+
+def _poster(poster_id, created_at, version=1):
+    return {
+        "id": poster_id, "file_id": f"file-{poster_id}", "caption": f"Афиша {poster_id}",
+        "ticket_url": None, "created_at": created_at, "is_active": True, "version": version, "updated_at": None,
+    }
+
+
+@pytest.fixture
+def posters(monkeypatch):
+    base = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    # id и created_at расходятся: id 3 создана раньше всех, у 1 и 4 одинаковое время
+    rows = [
+        _poster(1, base + timedelta(hours=2)),
+        _poster(2, base + timedelta(hours=1)),
+        _poster(3, base),
+        _poster(4, base + timedelta(hours=2)),
+        _poster(5, base + timedelta(hours=3)),
+    ]
+    monkeypatch.setattr(api, "poster_cache", PosterStore(rows))
+    monkeypatch.setattr(api, "posters_loaded", True)
+    monkeypatch.setattr(api, "_posters_snapshot", None)
+    return rows
+
+
+def _all_pages(limit):
+    ids, cursor = [], None
+    while True:
+        rows, items, cursor = asyncio.run(api._posters_page(limit, cursor))
+        ids.extend(item["id"] for item in items)
+        if cursor is None:
+            return ids
+
+
+def test_snapshot_order_is_created_at_then_id_desc(posters):
+    snapshot = api._get_posters_snapshot()
+    assert [item["id"] for item in snapshot.items] == [5, 4, 1, 2, 3]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 10])
+def test_pages_follow_snapshot_order(posters, limit):
+    assert _all_pages(limit) == [5, 4, 1, 2, 3]
+
+
+def test_next_cursor_points_at_last_item(posters):
+    _, items, cursor = asyncio.run(api._posters_page(2, None))
+    assert decode_keyset_cursor(cursor)[1] == items[-1]["id"] == 4
+
+
+def test_page_etag_changes_with_version_and_fields(posters):
+    rows, _, cursor = asyncio.run(api._posters_page(2, None))
+    etag = api._page_etag(rows, cursor, None)
+    assert api._page_etag(rows, cursor, None) == etag
+    assert api._page_etag(rows, cursor, "id,title") != etag
+    bumped = [dict(rows[0], version=2)] + rows[1:]
+    assert api._page_etag(bumped, cursor, None) != etag
+
+
+def test_deleted_poster_leaves_attendance_rollup(posters, monkeypatch):
+    monkeypatch.setattr(api, "attendance_rollup", api.AttendanceRollup())
+    api.attendance_rollup._by_poster = {3: {"total_attendees": 5}, 4: {"total_attendees": 2}}
+    monkeypatch.setattr(api, "_posters_changed", lambda: None)
+    asyncio.run(api._apply_poster_change({"id": 3, "version": 9, "op": "delete"}))
+    assert 3 not in api.attendance_rollup._by_poster
+    assert 4 in api.attendance_rollup._by_poster
+    assert 3 not in api.poster_cache
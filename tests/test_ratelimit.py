@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import ratelimit
+from ratelimit import TokenBucketLimiter, client_ip
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_wait(clock):
+    limiter = TokenBucketLimiter("test", per_minute=60, burst=3)
+    assert [limiter.acquire("a") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("a") == pytest.approx(1.0)
+
+
+def test_refills_at_rate_up_to_burst(clock):
+    limiter = TokenBucketLimiter("test", per_minute=60, burst=2)
+    limiter.acquire("a")
+    limiter.acquire("a")
+    clock[0] += 1
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") > 0
+    # Долгий простой не копит токенов больше burst
+    clock[0] += 3600
+    assert [limiter.acquire("a") for _ in range(2)] == [0, 0]
+    assert limiter.acquire("a") > 0
+
+
+def test_clients_have_separate_buckets(clock):
+    limiter = TokenBucketLimiter("test", per_minute=60, burst=1)
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") > 0
+    assert limiter.acquire("b") == 0
+
+
+def test_zero_rate_never_refills(clock):
+    limiter = TokenBucketLimiter("test", per_minute=0, burst=1)
+    assert limiter.acquire("a") == 0
+    clock[0] += 3600
+    assert limiter.acquire("a") == 60.0
+
+
+def test_evicts_least_recently_used_client(clock):
+    limiter = TokenBucketLimiter("test", per_minute=60, burst=1, max_clients=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("a")
+    limiter.acquire("c")
+    assert list(limiter._buckets) == ["a", "c"]
+
+
+def _request(host, real_ip=None):
+    headers = {"x-real-ip": real_ip} if real_ip else {}
+    return SimpleNamespace(client=SimpleNamespace(host=host), headers=headers)
+
+
+def test_client_ip_trusts_header_only_from_proxy():
+    assert client_ip(_request("127.0.0.1", "203.0.113.7")) == "203.0.113.7"
+    assert client_ip(_request("198.51.100.1", "203.0.113.7")) == "198.51.100.1"
+
+
+def test_dependency_raises_429_with_retry_after(clock):
+    limiter = TokenBucketLimiter("test", per_minute=30, burst=1)
+    request = _request("198.51.100.1")
+    asyncio.run(limiter(request))
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(limiter(request))
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers["Retry-After"] == "2"
+
+
+def test_per_worker_limiter_splits_budget(clock):
+    limiter = ratelimit.per_worker_limiter("test", per_minute=120, burst=40, workers=4)
+    assert limiter.rate == pytest.approx(0.5)
+    assert limiter.burst == 10
+    assert ratelimit.per_worker_limiter("test", per_minute=60, burst=3, workers=4).burst == 1
@@ -0,0 +1,50 @@
+import gzip
+
+import pytest
+
+import response_encoding
+from response_encoding import compress, negotiate_encoding
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    # Сам пакет не нужен: negotiate_encoding смотрит только, импортирован ли он
+    monkeypatch.setattr(response_encoding, "brotli", object())
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(response_encoding, "brotli", None)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("gzip;q=0.8, br;q=0.9", "br"),
+    ("gzip", "gzip"),
+    ("*", "br"),
+    ("br;q=0, *", "gzip"),
+    ("identity", None),
+    ("", None),
+    ("br;q=0, gzip;q=0", None),
+    ("GZIP;Q=1", "gzip"),
+    ("gzip;q=abc", None),
+])
+def test_negotiate_with_brotli(with_brotli, header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "gzip"),
+    ("br", None),
+    ("*", "gzip"),
+    ("gzip;q=0", None),
+])
+def test_negotiate_without_brotli(without_brotli, header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+def test_gzip_is_deterministic():
+    body = b'{"posters": []}' * 100
+    assert compress(body, "gzip") == compress(body, "gzip")
+    assert gzip.decompress(compress(body, "gzip")) == body
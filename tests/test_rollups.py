@@ -0,0 +1,72 @@
+import asyncio
+
+import rollups
+
+
+class FakeAttendances:
+    """Таблица attendances в памяти: видны только закоммиченные строки"""
+
+    def __init__(self):
+        self.rows = []
+
+    def commit(self, id, poster_id, gender="male", age=20):
+        self.rows.append({"id": id, "poster_id": poster_id, "gender": gender, "age": age})
+
+    async def max_id(self, pool):
+        return max((row["id"] for row in self.rows), default=0)
+
+    async def rollup(self, pool, up_to_id):
+        by_poster = {}
+        for row in self.rows:
+            if row["id"] <= up_to_id:
+                counters = by_poster.setdefault(row["poster_id"], dict.fromkeys(rollups.ROLLUP_COUNTERS, 0))
+                counters["total_attendees"] += 1
+                counters["male_count"] += row["gender"] == "male"
+        return [{"poster_id": poster_id, **counters} for poster_id, counters in by_poster.items()]
+
+    async def after(self, pool, after_id):
+        return [dict(row) for row in self.rows if row["id"] > after_id]
+
+
+def make_rollup(monkeypatch, table, overlap_ids=10):
+    monkeypatch.setattr(rollups, "get_max_attendance_id", table.max_id)
+    monkeypatch.setattr(rollups, "get_attendance_rollup", table.rollup)
+    monkeypatch.setattr(rollups, "get_attendances_after", table.after)
+    return rollups.AttendanceRollup(overlap_ids=overlap_ids)
+
+
+def totals(rollup):
+    data = asyncio.run(rollup.get(None))
+    return {poster_id: counters["total_attendees"] for poster_id, counters in data.items()}
+
+
+def test_late_commit_with_lower_id_is_counted(monkeypatch):
+    table = FakeAttendances()
+    rollup = make_rollup(monkeypatch, table)
+    for i in range(1, 30):
+        table.commit(i, poster_id=1)
+    asyncio.run(rollup.refresh(None, full=True))
+
+    # id 31 закоммичен раньше id 30
+    table.commit(31, poster_id=1)
+    asyncio.run(rollup.refresh(None))
+    table.commit(30, poster_id=1)
+    asyncio.run(rollup.refresh(None))
+    asyncio.run(rollup.refresh(None))
+
+    assert totals(rollup) == {1: 31}
+
+
+def test_counts_match_full_rebuild(monkeypatch):
+    table = FakeAttendances()
+    rollup = make_rollup(monkeypatch, table, overlap_ids=3)
+    asyncio.run(rollup.refresh(None, full=True))
+    for i in range(1, 20):
+        table.commit(i, poster_id=i % 3, gender="female" if i % 2 else "male", age=None if i % 5 == 0 else 15 + i)
+        asyncio.run(rollup.refresh(None))
+    incremental = asyncio.run(rollup.get(None))
+
+    asyncio.run(rollup.refresh(None, full=True))
+    rebuilt = asyncio.run(rollup.get(None))
+    assert {k: v["total_attendees"] for k, v in incremental.items()} == {k: v["total_attendees"] for k, v in rebuilt.items()}
+    assert {k: v["male_count"] for k, v in incremental.items()} == {k: v["male_count"] for k, v in rebuilt.items()}